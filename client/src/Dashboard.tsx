@@ -30,6 +30,14 @@ type ExamResult = {
   schemeFileName: string;
 };
 
+type ExamSummary = {
+  id: string;
+  timestamp: string;
+  studentFileName: string;
+  schemeFileName: string;
+  total: string;
+};
+
 const theme = extendTheme({
   fonts: {
     heading: "Inter, sans-serif",
@@ -38,8 +46,10 @@ const theme = extendTheme({
 });
 
 function Dashboard() {
-  const [exams, setExams] = useState<ExamResult[]>([]);
+  const [exams, setExams] = useState<ExamSummary[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedExam, setSelectedExam] = useState<ExamResult | null>(null);
   const { isOpen, onOpen, onClose } = useDisclosure();
   const toast = useToast();
@@ -56,21 +66,25 @@ function Dashboard() {
     if (user !== undefined && user) fetchExams();
   }, [user]);
 
-  const fetchExams = async () => {
+  const fetchExams = async (cursor: string | null = null) => {
     setError(null);
-    setLoading(true);
+    if (cursor) setLoadingMore(true);
+    else setLoading(true);
     try {
       const token = await getIdToken(auth.currentUser!);
-      const res = await fetch("https://ai-examiner-79zf.onrender.com/exams", {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+      const res = await fetch(`https://ai-examiner-79zf.onrender.com/exams${query}`, {
         headers: { Authorization: `Bearer ${token}` },
       });
       if (!res.ok) throw new Error("Failed to fetch exams");
       const data = await res.json();
-      setExams(data);
+      setExams((prev) => (cursor ? [...prev, ...data.exams] : data.exams));
+      setNextCursor(data.nextCursor);
     } catch {
       setError("Something went wrong. Try again later.");
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -148,7 +162,7 @@ function Dashboard() {
         {error && (
           <VStack spacing={3} mb={6}>
             <Text color="red.500">{error}</Text>
-            <Button colorScheme="green" onClick={fetchExams}>Retry</Button>
+            <Button colorScheme="green" onClick={() => fetchExams()}>Retry</Button>
           </VStack>
         )}
         {loading ? (
@@ -190,7 +204,7 @@ function Dashboard() {
                 </HStack>
                 <HStack justifyContent="space-between" alignItems="center" mt={2}>
                   <Badge colorScheme="green" px={3} py={1} borderRadius="lg" fontSize="lg" fontWeight="bold" letterSpacing="tight">
-                    {exam.result.total}
+                    {exam.total}
                   </Badge>
                   <Button
                     size="md"
@@ -206,6 +220,18 @@ function Dashboard() {
                 </HStack>
               </Box>
             ))}
+            {nextCursor && (
+              <Button
+                alignSelf="center"
+                colorScheme="green"
+                variant="outline"
+                borderRadius="xl"
+                isLoading={loadingMore}
+                onClick={() => fetchExams(nextCursor)}
+              >
+                Load more
+              </Button>
+            )}
           </VStack>
         )}
       </Box>
@@ -50,13 +50,15 @@ const ExamPage = () => {
     setLoading(true);
     try {
       const token = await getIdToken(auth.currentUser!);
-      const res = await fetch(`https://ai-examiner-79zf.onrender.com/exams`, {
+      const res = await fetch(`https://ai-examiner-79zf.onrender.com/exams/${id}`, {
         headers: { Authorization: `Bearer ${token}` },
       });
+      if (res.status === 404) {
+        setExam(null);
+        return;
+      }
       if (!res.ok) throw new Error("Failed to fetch exam");
-      const data = await res.json();
-      const found = data.find((e: any) => e.id === id);
-      setExam(found);
+      setExam(await res.json());
     } catch (err) {
       setError("Failed to load exam. Please try again later.");
     } finally {
@@ -0,0 +1,65 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+TOKEN_CACHE_MAX_TTL = int(os.getenv("TOKEN_CACHE_MAX_TTL", "3600"))
+
+
+class TokenCache:
+    """Verified ID token claims, keyed by a hash of the token.
+
+    Entries expire at the token's own "exp" (or after max_ttl, whichever is
+    sooner), and the least recently used are dropped beyond max_entries.
+    Failed verifications are never cached.
+    """
+
+    def __init__(self, verify: Callable[[str], dict], max_entries: int = TOKEN_CACHE_MAX_ENTRIES, max_ttl: int = TOKEN_CACHE_MAX_TTL):
+        self._verify = verify
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def verify(self, token: str) -> dict:
+        claims = self.get(token)
+        if claims is not None:
+            return claims
+
+        claims = self._verify(token)
+        now = time.time()
+        expires_at = min(float(claims.get("exp", now)), now + self.max_ttl)
+        with self._lock:
+            self.misses += 1
+            self._entries[self._key(token)] = (claims, expires_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return claims
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
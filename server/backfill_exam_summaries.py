@@ -0,0 +1,36 @@
+"""One-off migration for exams written before summaries were stored.
+
+Adds the "summary" field and rewrites string/dict timestamps as Firestore
+timestamps so /exams can order and project server-side.
+
+    FIREBASE_CONFIG_JSON=... python server/backfill_exam_summaries.py
+"""
+from datetime import datetime
+
+from main import FIRESTORE_BATCH_SIZE, db, exam_summary, normalize_timestamp
+
+
+def main():
+    batch, pending, updated = db.batch(), 0, 0
+    for exam in db.collection("exams").stream():
+        data = exam.to_dict()
+        changes = {}
+        if "summary" not in data:
+            changes["summary"] = exam_summary(data.get("result", {}))
+        if not isinstance(data.get("timestamp"), datetime):
+            changes["timestamp"] = normalize_timestamp(data.get("timestamp"))
+        if not changes:
+            continue
+        batch.update(exam.reference, changes)
+        pending += 1
+        updated += 1
+        if pending == FIRESTORE_BATCH_SIZE:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    print(f"Updated {updated} exams")
+
+
+if __name__ == "__main__":
+    main()
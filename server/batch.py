@@ -0,0 +1,123 @@
+import os
+import re
+import zipfile
+from io import BytesIO
+from typing import Optional
+
+
+MAX_BATCH_SCRIPTS = int(os.getenv("MAX_BATCH_SCRIPTS", "120"))
+# Uncompressed size of the PDFs in one archive
+MAX_BATCH_ARCHIVE_BYTES = int(os.getenv("MAX_BATCH_ARCHIVE_BYTES", str(200 * 1024 * 1024)))
+
+MARK_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)")
+
+
+class BatchTooLargeError(ValueError):
+    pass
+
+
+def _open_zip(archive_bytes: bytes) -> zipfile.ZipFile:
+    try:
+        return zipfile.ZipFile(BytesIO(archive_bytes))
+    except zipfile.BadZipFile:
+        raise ValueError("Archive is not a valid zip file")
+
+
+def _pdf_entries(archive: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    entries = sorted(
+        (info for info in archive.infolist()
+         if not info.is_dir()
+         and info.filename.lower().endswith(".pdf")
+         and not os.path.basename(info.filename).startswith(".")
+         and "__MACOSX" not in info.filename),
+        key=lambda info: info.filename,
+    )
+    if len(entries) > MAX_BATCH_SCRIPTS:
+        raise BatchTooLargeError(f"Archive has {len(entries)} PDFs, the limit is {MAX_BATCH_SCRIPTS}")
+    # file_size is the declared uncompressed size, checked before inflating anything
+    if sum(info.file_size for info in entries) > MAX_BATCH_ARCHIVE_BYTES:
+        raise BatchTooLargeError("Archive is too large once extracted")
+    return entries
+
+
+def count_pdfs_in_zip(archive_bytes: bytes) -> int:
+    """How many PDFs pdfs_from_zip would return, from the zip's directory alone."""
+    with _open_zip(archive_bytes) as archive:
+        return len(_pdf_entries(archive))
+
+
+def pdfs_from_zip(archive_bytes: bytes) -> list[tuple[str, bytes]]:
+    """(filename, bytes) for each PDF in a zip, in name order, ignoring folders and macOS metadata."""
+    with _open_zip(archive_bytes) as archive:
+        entries = _pdf_entries(archive)
+        try:
+            return [(os.path.basename(info.filename), archive.read(info)) for info in entries]
+        except zipfile.BadZipFile:
+            raise ValueError("Archive is corrupt")
+
+
+def parse_mark(mark: str, max_marks: str = "") -> tuple[Optional[float], Optional[float]]:
+    """Awarded and available marks from strings like "2/3" (max_marks is used if the mark has no "/")."""
+    match = MARK_PATTERN.search(mark or "")
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    try:
+        awarded = float((mark or "").strip())
+    except ValueError:
+        return None, None
+    try:
+        available = float((max_marks or "").strip())
+    except ValueError:
+        available = None
+    return awarded, available
+
+
+def _summary(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2) if values else None,
+        "min": min(values) if values else None,
+        "max": max(values) if values else None,
+    }
+
+
+def _mark_key(value: float) -> str:
+    return str(int(value)) if value == int(value) else str(value)
+
+
+def class_aggregates(results: list[dict]) -> dict:
+    """Per-question and whole-paper statistics across parse_marking_output results."""
+    questions: dict[str, dict] = {}
+    totals = []
+    total_available = 0.0
+
+    for result in results:
+        for q in result.get("questions", []):
+            awarded, available = parse_mark(q["mark"], q["maxMarks"])
+            if awarded is None:
+                continue
+            entry = questions.setdefault(q["questionNumber"], {"marks": [], "maxMarks": 0.0})
+            entry["marks"].append(awarded)
+            entry["maxMarks"] = max(entry["maxMarks"], available or 0.0)
+
+        awarded, available = parse_mark(result.get("total", ""))
+        if awarded is not None:
+            totals.append(awarded)
+            total_available = max(total_available, available or 0.0)
+
+    per_question = {}
+    for number, entry in questions.items():
+        distribution: dict[str, int] = {}
+        for mark in sorted(entry["marks"]):
+            distribution[_mark_key(mark)] = distribution.get(_mark_key(mark), 0) + 1
+        per_question[number] = {
+            **_summary(entry["marks"]),
+            "maxMarks": entry["maxMarks"],
+            "distribution": distribution,
+        }
+
+    return {
+        "scripts": len(results),
+        "questions": per_question,
+        "total": {**_summary(totals), "maxMarks": total_available},
+    }
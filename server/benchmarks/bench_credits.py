@@ -0,0 +1,102 @@
+"""Load test for the credit ledger and the token cache against in-memory fakes.
+
+    python server/benchmarks/bench_credits.py --uploads 40 --polls 200
+
+Simulates one user firing concurrent uploads at a 10-credit limit while
+their dashboard polls /usage. The old get-then-set path is compared with
+CreditLedger on the same latency-injected store, reporting store
+round-trips and how far each overshoots the limit. The token part counts
+verify calls for repeated requests carrying the same few tokens.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from auth_cache import TokenCache  # noqa: E402
+from credits import CreditLedger, CreditLimitError, InMemoryCreditStore  # noqa: E402
+
+MAX_CREDITS = 10
+UID = "teacher"
+
+
+def legacy_upload(store: InMemoryCreditStore) -> bool:
+    used = store.read(UID)
+    if used >= MAX_CREDITS:
+        return False
+    store.write(UID, used + 1)
+    return True
+
+
+def legacy_poll(store: InMemoryCreditStore) -> int:
+    return store.read(UID)
+
+
+def ledger_upload(ledger: CreditLedger) -> bool:
+    try:
+        ledger.reserve(UID, MAX_CREDITS)
+    except CreditLimitError:
+        return False
+    return True
+
+
+def run_credits(name: str, upload, poll, store: InMemoryCreditStore, uploads: int, polls: int, threads: int):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        upload_futures = [executor.submit(upload) for _ in range(uploads)]
+        poll_futures = [executor.submit(poll) for _ in range(polls)]
+        accepted = sum(f.result() for f in upload_futures)
+        for f in poll_futures:
+            f.result()
+    elapsed = time.perf_counter() - started
+    final = store.counters.get(UID, 0)
+    print(
+        f"{name:>8} {accepted:>9} {final:>13} {max(0, accepted - MAX_CREDITS):>10}"
+        f" {store.round_trips:>12} {store.round_trips / (uploads + polls):>10.2f} {elapsed:>8.2f}"
+    )
+
+
+def run_tokens(requests: int, tokens: int):
+    calls = {"count": 0}
+
+    def verify(token: str) -> dict:
+        calls["count"] += 1
+        time.sleep(0.002)
+        return {"uid": token, "exp": time.time() + 3600}
+
+    cache = TokenCache(verify)
+    started = time.perf_counter()
+    for i in range(requests):
+        cache.verify(f"token-{i % tokens}")
+    elapsed = time.perf_counter() - started
+    print(f"token verification: {requests} requests, {tokens} tokens -> {calls['count']} verify calls"
+          f" ({requests} without the cache), {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=40)
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per simulated Firestore round-trip")
+    args = parser.parse_args()
+
+    print(f"{'':>8} {'accepted':>9} {'credits_used':>13} {'overspend':>10} {'round_trips':>12} {'per_req':>10} {'seconds':>8}")
+
+    legacy_store = InMemoryCreditStore(latency=args.latency)
+    run_credits("legacy", lambda: legacy_upload(legacy_store), lambda: legacy_poll(legacy_store),
+                legacy_store, args.uploads, args.polls, args.threads)
+
+    ledger_store = InMemoryCreditStore(latency=args.latency)
+    ledger = CreditLedger(ledger_store)
+    run_credits("ledger", lambda: ledger_upload(ledger), lambda: ledger.used(UID),
+                ledger_store, args.uploads, args.polls, args.threads)
+
+    run_tokens(requests=1000, tokens=20)
+
+
+if __name__ == "__main__":
+    main()
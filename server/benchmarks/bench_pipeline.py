@@ -0,0 +1,156 @@
+"""End-to-end load test of POST /mark against local fakes.
+
+    python server/benchmarks/bench_pipeline.py --levels 1,4,16 --requests 32 --pages 3
+
+Starts stub_openai on a local port and imports the app without the
+Firebase secret (FIREBASE_OPTIONAL=1), swapping in FakeFirestore, an
+in-memory credit ledger and a token cache that accepts any token (every
+request is its own user).
+Requests go through httpx's ASGI transport, so the app runs in this
+process exactly as under uvicorn minus the socket. For each concurrency
+level it reports throughput, p50/p99 latency and the mean time per
+pipeline stage taken from /metrics. Needs poppler on PATH.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+STAGE_LINE = re.compile(r'^marking_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', re.M)
+
+
+def start_stub(port: int, latency: float):
+    os.environ["STUB_LATENCY"] = str(latency)
+    import uvicorn
+    import stub_openai
+
+    server = uvicorn.Server(uvicorn.Config(stub_openai.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def stage_totals(metrics_text: str) -> dict[str, list[float]]:
+    totals: dict[str, list[float]] = {}
+    for kind, stage, value in STAGE_LINE.findall(metrics_text):
+        totals.setdefault(stage, [0.0, 0.0])[0 if kind == "sum" else 1] = float(value)
+    return totals
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, round(q * (len(sorted_values) - 1)))]
+
+
+async def run_level(client, level: int, requests: int, students: list[bytes], scheme: bytes, bypass_cache: bool):
+    semaphore = asyncio.Semaphore(level)
+    latencies, failures = [], []
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(
+                "/mark",
+                params={"bypass_cache": str(bypass_cache).lower()},
+                headers={"Authorization": f"Bearer bench-{level}-{i}"},
+                files={
+                    "student": (f"student-{i}.pdf", students[i % len(students)], "application/pdf"),
+                    "scheme": ("scheme.pdf", scheme, "application/pdf"),
+                },
+            )
+            elapsed = time.perf_counter() - started
+        if response.status_code == 200:
+            latencies.append(elapsed)
+        else:
+            failures.append(response.status_code)
+        return response
+
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+    return sorted(latencies), failures, wall, responses[-1].headers.get("server-timing", "")
+
+
+async def run(args):
+    from bench_rasterize import synthetic_pdf
+
+    # Never let a benchmark reach a real project
+    os.environ.pop("FIREBASE_CONFIG_JSON", None)
+    os.environ["FIREBASE_OPTIONAL"] = "1"
+    start_stub(args.port, args.stub_latency)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["OPENAI_API_KEY"] = "stub"
+
+    import httpx
+    import main
+    from auth_cache import TokenCache
+    from credits import CreditLedger, InMemoryCreditStore
+    from fake_firestore import FakeFirestore
+
+    main.db = FakeFirestore(latency=args.firestore_latency)
+    main.credit_ledger = CreditLedger(InMemoryCreditStore(latency=args.firestore_latency))
+    main.token_cache = TokenCache(lambda token: {"uid": token, "exp": time.time() + 3600})
+
+    print(f"generating {args.variants} student scripts of {args.pages} pages and a {args.scheme_pages}-page scheme...")
+    students = [synthetic_pdf(args.pages, seed=i) for i in range(args.variants)]
+    scheme = synthetic_pdf(args.scheme_pages, seed=1000)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{'concurrency':>11} {'ok':>5} {'failed':>6} {'req/s':>7} {'pages/s':>8} {'p50_s':>7} {'p99_s':>7}")
+        reports = []
+        for level in args.levels:
+            before = stage_totals((await client.get("/metrics")).text)
+            # The server logs every page; keep the table readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies, failures, wall, server_timing = await run_level(
+                    client, level, args.requests, students, scheme, bypass_cache=not args.use_cache
+                )
+            after = stage_totals((await client.get("/metrics")).text)
+            ok = len(latencies)
+            p50 = percentile(latencies, 0.50) if latencies else float("nan")
+            p99 = percentile(latencies, 0.99) if latencies else float("nan")
+            print(f"{level:>11} {ok:>5} {len(failures):>6} {ok / wall:>7.2f} {ok * args.pages / wall:>8.2f} {p50:>7.2f} {p99:>7.2f}")
+            reports.append((level, before, after, server_timing))
+
+        for level, before, after, server_timing in reports:
+            print(f"\nconcurrency {level}: mean seconds per stage (calls)")
+            for stage, (total, count) in sorted(after.items()):
+                total -= before.get(stage, [0.0, 0.0])[0]
+                count -= before.get(stage, [0.0, 0.0])[1]
+                if count:
+                    print(f"  {stage:>16} {total / count:>8.4f} ({int(count)})")
+            print(f"  last Server-Timing: {server_timing}")
+
+        metrics_text = (await client.get("/metrics")).text
+        print()
+        for line in metrics_text.splitlines():
+            if line.startswith(("model_tokens_total", "model_calls_total", "pages_rendered_total", "upload_bytes_total")):
+                print(line)
+        print(f"firestore round-trips: {main.db.round_trips}, exams stored: {main.db.documents('exams')}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", type=lambda s: [int(x) for x in s.split(",")], default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    parser.add_argument("--pages", type=int, default=3, help="pages per student script")
+    parser.add_argument("--scheme-pages", type=int, default=4)
+    parser.add_argument("--variants", type=int, default=4, help="distinct student scripts to cycle through")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="seconds per stub model call")
+    parser.add_argument("--firestore-latency", type=float, default=0.02, help="seconds per simulated Firestore round-trip")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--use-cache", action="store_true", help="allow result-cache hits instead of marking every request")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
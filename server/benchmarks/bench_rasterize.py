@@ -0,0 +1,124 @@
+"""Compare the old whole-PDF PNG rasterization with the streaming rasterizer.
+
+    python server/benchmarks/bench_rasterize.py --pages 4 12 24
+
+Each run happens in a fresh process so peak RSS is measured per strategy.
+Needs poppler on PATH, like the server itself.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from base64 import b64encode
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+
+def synthetic_pdf(pages: int, dpi: int = 200, seed: int = 0) -> bytes:
+    """A4 pages of ruled 'handwriting' with scanner noise, embedded as images like a real scan."""
+    rng = random.Random(seed)
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    images = []
+    for page in range(pages):
+        img = Image.new("RGB", (width, height), (250, 248, 240))
+        draw = ImageDraw.Draw(img)
+        for y in range(dpi, height - dpi, dpi // 3):
+            draw.line([(dpi // 2, y), (width - dpi // 2, y)], fill=(190, 200, 230), width=2)
+            x = dpi // 2
+            while x < width - dpi:
+                w = rng.randint(dpi // 10, dpi // 3)
+                draw.arc([x, y - dpi // 5, x + w, y], rng.randint(0, 180), rng.randint(180, 360), fill=(30, 30, 90), width=3)
+                x += w + rng.randint(5, dpi // 8)
+        draw.text((dpi // 2, dpi // 3), f"Page {page + 1}", fill=(0, 0, 0))
+        for _ in range(4000):
+            px, py = rng.randrange(width), rng.randrange(height)
+            img.putpixel((px, py), (rng.randint(150, 255),) * 3)
+        images.append(img)
+    buffered = BytesIO()
+    images[0].save(buffered, format="PDF", save_all=True, append_images=images[1:], resolution=dpi)
+    return buffered.getvalue()
+
+
+def legacy_rasterize(pdf_bytes: bytes) -> list[str]:
+    from pdf2image import convert_from_bytes
+
+    images = convert_from_bytes(pdf_bytes)
+    encoded = []
+    for img in images:
+        buffered = BytesIO()
+        img.save(buffered, format="PNG")
+        encoded.append(b64encode(buffered.getvalue()).decode("utf-8"))
+    return encoded
+
+
+def streaming_rasterize(pdf_bytes: bytes) -> list[str]:
+    from rendering import pdf_to_base64_images
+
+    return pdf_to_base64_images(pdf_bytes)
+
+
+STRATEGIES = {"legacy": legacy_rasterize, "streaming": streaming_rasterize}
+
+
+def run_strategy(name: str, pdf_path: str, queue) -> None:
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    pages = STRATEGIES[name](pdf_bytes)
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        "seconds": elapsed,
+        "peak_rss_mb": peak_kb / 1024,
+        "rss_growth_mb": (peak_kb - baseline_kb) / 1024,
+        "payload_mb": sum(len(p) for p in pages) / 1024 / 1024,
+        "pages": len(pages),
+    })
+
+
+def measure(name: str, pdf_path: str) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_strategy, args=(name, pdf_path, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[4, 12, 24])
+    parser.add_argument("--scan-dpi", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'pages':>5} {'strategy':>10} {'seconds':>8} {'peak MB':>8} {'growth MB':>9} {'payload MB':>10}")
+    for pages in args.pages:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(synthetic_pdf(pages, dpi=args.scan_dpi))
+            pdf_path = f.name
+        try:
+            results = {name: measure(name, pdf_path) for name in STRATEGIES}
+        finally:
+            os.unlink(pdf_path)
+        for name, r in results.items():
+            print(f"{pages:>5} {name:>10} {r['seconds']:>8.2f} {r['peak_rss_mb']:>8.1f} {r['rss_growth_mb']:>9.1f} {r['payload_mb']:>10.2f}")
+        legacy, streaming = results["legacy"], results["streaming"]
+        print(
+            f"{'':>5} {'ratio':>10} {legacy['seconds'] / streaming['seconds']:>8.1f}x"
+            f" {legacy['peak_rss_mb'] / streaming['peak_rss_mb']:>7.1f}x"
+            f" {legacy['rss_growth_mb'] / max(streaming['rss_growth_mb'], 0.1):>8.1f}x"
+            f" {legacy['payload_mb'] / streaming['payload_mb']:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Payload and token cost of marking with and without the per-question scheme index.
+
+    python server/benchmarks/bench_scheme_index.py --questions 6 --scheme-pages 8
+
+The model is stubbed in-process, so nothing is sent upstream. Image tokens
+use OpenAI's published tile formula; text tokens are estimated at 4 chars
+per token. Needs poppler on PATH to render the scheme pages.
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+from base64 import b64decode, b64encode
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+import marking  # noqa: E402
+from rendering import pdf_to_base64_images  # noqa: E402
+from scheme_index import build_scheme_index  # noqa: E402
+
+
+def text_pdf(pages: list[list[str]]) -> bytes:
+    """Minimal PDF with a real text layer, one Helvetica line per entry."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 12 TL 50 800 Td " + " ".join(
+            "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj T*" for line in lines
+        ) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {content_id} 0 R /Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def synthetic_scheme(questions: int, pages: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    lines = []
+    for q in range(1, questions + 1):
+        for part in range(1, 4):
+            lines.append(f"{q:02d}.{part} Describe what happens to the particles when the substance is heated")
+            for _ in range(6):
+                lines.append("- " + " ".join(rng.choice(["energy", "particles", "vibrate", "faster", "bonds", "allow", "ignore", "1 mark"]) for _ in range(10)))
+    per_page = math.ceil(len(lines) / pages)
+    return text_pdf([lines[i:i + per_page] for i in range(0, len(lines), per_page)])
+
+
+def synthetic_student_pages(questions: int) -> list[str]:
+    pages = []
+    for q in range(1, questions + 1):
+        img = Image.new("L", (1240, 1754), 250)
+        draw = ImageDraw.Draw(img)
+        draw.text((60, 60), f"{q:02d}.1", fill=0)
+        for y in range(120, 1700, 40):
+            draw.line([(60, y), (1180, y)], fill=120)
+        buffered = BytesIO()
+        img.save(buffered, format="JPEG", quality=80)
+        pages.append(b64encode(buffered.getvalue()).decode("utf-8"))
+    return pages
+
+
+def image_tokens(url: str, detail: str) -> int:
+    if detail == "low":
+        return 85
+    width, height = Image.open(BytesIO(b64decode(url.split(",", 1)[1]))).size
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+class StubModel:
+    def __init__(self, page_questions: dict[str, str]):
+        self.page_questions = page_questions
+        self.calls = 0
+        self.payload_bytes = 0
+        self.tokens = 0
+
+    async def __call__(self, content: list[dict], max_tokens: int = 1000) -> str:
+        self.calls += 1
+        for part in content:
+            if part["type"] == "text":
+                self.payload_bytes += len(part["text"])
+                self.tokens += len(part["text"]) // 4
+            else:
+                url = part["image_url"]["url"]
+                self.payload_bytes += len(url)
+                self.tokens += image_tokens(url, part["image_url"].get("detail", "high"))
+        if content[0]["text"] == marking.DETECT_QUESTIONS_PROMPT:
+            return self.page_questions[content[1]["image_url"]["url"]]
+        return "---\nQuestion Number: 1\nMark: 1/2\n---"
+
+
+async def run(student_pages: list[str], scheme_pages: list[str], scheme_index, page_questions: dict[str, str]) -> StubModel:
+    stub = StubModel(page_questions)
+    marking.complete_with_retry = stub
+    await marking.mark_with_vision(student_pages, scheme_pages, scheme_index=scheme_index)
+    return stub
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=6)
+    parser.add_argument("--scheme-pages", type=int, default=8)
+    args = parser.parse_args()
+
+    scheme_pdf = synthetic_scheme(args.questions, args.scheme_pages)
+    scheme_pages = pdf_to_base64_images(scheme_pdf)
+    scheme_index = build_scheme_index(scheme_pdf)
+    student_pages = synthetic_student_pages(args.questions)
+    page_questions = {
+        marking.image_block(img)["image_url"]["url"]: str(q)
+        for q, img in enumerate(student_pages, start=1)
+    }
+    print(f"indexed questions: {sorted(scheme_index['questions'], key=int)}")
+
+    before = asyncio.run(run(student_pages, scheme_pages, None, page_questions))
+    after = asyncio.run(run(student_pages, scheme_pages, scheme_index, page_questions))
+
+    print(f"{'':>8} {'calls':>6} {'payload MB':>11} {'est. tokens':>12}")
+    for name, stub in (("before", before), ("after", after)):
+        print(f"{name:>8} {stub.calls:>6} {stub.payload_bytes / 1024 / 1024:>11.2f} {stub.tokens:>12}")
+    print(f"{'ratio':>8} {'':>6} {before.payload_bytes / after.payload_bytes:>10.1f}x {before.tokens / after.tokens:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
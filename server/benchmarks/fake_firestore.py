@@ -0,0 +1,231 @@
+"""In-memory stand-in for the parts of the Firestore client the server uses.
+
+Covers document get/set/delete, batches, transactions, Increment, and
+where("==")/order_by/select/limit/start_after queries. Transactions are
+optimistic: commit aborts if a document read in the transaction has changed
+since, and fake_transactional retries the function the way
+firestore.transactional does. `latency` simulates a round-trip per read and
+per commit.
+"""
+import itertools
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeAborted(Exception):
+    pass
+
+
+class FakeDocument:
+    def __init__(self, collection, id: str):
+        self.collection = collection
+        self.id = id
+
+    def get(self, field_paths=None, transaction=None):
+        db = self.collection.db
+        db._round_trip()
+        key = (self.collection.name, self.id)
+        with db._lock:
+            data = db._docs.get(key)
+            if transaction is not None:
+                transaction.reads.setdefault(key, db._versions.get(key, 0))
+        if data is not None and field_paths is not None:
+            data = {f: data[f] for f in field_paths if f in data}
+        return FakeSnapshot(self, data)
+
+    def set(self, data: dict, merge: bool = False):
+        db = self.collection.db
+        db._round_trip()
+        db._write(self, data, merge)
+
+    def delete(self):
+        db = self.collection.db
+        db._round_trip()
+        key = (self.collection.name, self.id)
+        with db._lock:
+            db._docs.pop(key, None)
+            db._versions[key] = db._versions.get(key, 0) + 1
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), order=None, fields=None, count=None, after=None):
+        self.collection = collection
+        self.filters = filters
+        self.order = order
+        self.fields = fields
+        self.count = count
+        self.after = after
+
+    def _with(self, **changes):
+        options = {"filters": self.filters, "order": self.order, "fields": self.fields, "count": self.count, "after": self.after}
+        return FakeQuery(self.collection, **{**options, **changes})
+
+    def where(self, field: str, op: str, value):
+        if op != "==":
+            raise NotImplementedError(f"FakeQuery only supports '==', not {op!r}")
+        return self._with(filters=self.filters + ((field, value),))
+
+    def order_by(self, field: str, direction: str = "ASCENDING"):
+        return self._with(order=(field, direction))
+
+    def select(self, fields: list[str]):
+        return self._with(fields=list(fields))
+
+    def limit(self, count: int):
+        return self._with(count=count)
+
+    def start_after(self, snapshot: FakeSnapshot):
+        return self._with(after=snapshot.id)
+
+    def get(self) -> list[FakeSnapshot]:
+        db = self.collection.db
+        db._round_trip()
+        with db._lock:
+            rows = [
+                (doc_id, data) for (name, doc_id), data in db._docs.items()
+                if name == self.collection.name and all(data.get(f) == v for f, v in self.filters)
+            ]
+        if self.order:
+            field, direction = self.order
+            rows.sort(key=lambda row: row[1].get(field), reverse=direction == "DESCENDING")
+        if self.after is not None:
+            ids = [doc_id for doc_id, _ in rows]
+            rows = rows[ids.index(self.after) + 1:] if self.after in ids else []
+        if self.count is not None:
+            rows = rows[:self.count]
+        return [
+            FakeSnapshot(
+                FakeDocument(self.collection, doc_id),
+                {f: data[f] for f in self.fields if f in data} if self.fields else data,
+            )
+            for doc_id, data in rows
+        ]
+
+    stream = get
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, name: str):
+        super().__init__(self)
+        self.db = db
+        self.name = name
+
+    def document(self, id: str = None) -> FakeDocument:
+        return FakeDocument(self, id or f"doc{next(self.db._ids)}")
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, reference: FakeDocument, data: dict, merge: bool = False):
+        self.writes.append((reference, data, merge))
+
+    def update(self, reference: FakeDocument, data: dict):
+        self.writes.append((reference, data, True))
+
+    def commit(self):
+        self.db._round_trip()
+        for reference, data, merge in self.writes:
+            self.db._write(reference, data, merge)
+        self.writes = []
+
+
+class FakeTransaction:
+    def __init__(self, db):
+        self.db = db
+        self.reads: dict[tuple[str, str], int] = {}
+        self.writes = []
+
+    def set(self, reference: FakeDocument, data: dict, merge: bool = False):
+        self.writes.append((reference, data, merge))
+
+    def update(self, reference: FakeDocument, data: dict):
+        self.writes.append((reference, data, True))
+
+    def commit(self):
+        db = self.db
+        db._round_trip()
+        with db._lock:
+            if any(db._versions.get(key, 0) != version for key, version in self.reads.items()):
+                raise FakeAborted()
+            for reference, data, merge in self.writes:
+                db._write(reference, data, merge)
+
+    def reset(self):
+        self.reads = {}
+        self.writes = []
+
+
+def fake_transactional(fn, max_attempts: int = 100):
+    """Stand-in for firestore.transactional that works with FakeTransaction."""
+    def run(transaction: FakeTransaction, *args, **kwargs):
+        for attempt in range(max_attempts):
+            transaction.reset()
+            result = fn(transaction, *args, **kwargs)
+            try:
+                transaction.commit()
+                return result
+            except FakeAborted:
+                if attempt == max_attempts - 1:
+                    raise
+    return run
+
+
+class FakeFirestore:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self._docs: dict[tuple[str, str], dict] = {}
+        self._versions: dict[tuple[str, str], int] = {}
+        self._ids = itertools.count(1)
+        # Reentrant so a transaction can check its reads and write under one hold
+        self._lock = threading.RLock()
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _write(self, reference: FakeDocument, data: dict, merge: bool):
+        from firebase_admin import firestore
+
+        key = (reference.collection.name, reference.id)
+        with self._lock:
+            current = self._docs.get(key, {})
+            resolved = {}
+            for k, v in data.items():
+                if v is firestore.SERVER_TIMESTAMP:
+                    v = datetime.now(timezone.utc)
+                elif isinstance(v, firestore.Increment):
+                    v = current.get(k, 0) + v.value
+                resolved[k] = v
+            self._docs[key] = {**current, **resolved} if merge else resolved
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def transaction(self) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def documents(self, collection: str) -> int:
+        with self._lock:
+            return sum(1 for name, _ in self._docs if name == collection)
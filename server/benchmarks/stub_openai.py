@@ -0,0 +1,103 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Run it and point the server at it:
+
+    uvicorn stub_openai:app --app-dir server/benchmarks --port 8100
+    OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=stub uvicorn main:app --app-dir server
+
+STUB_LATENCY (seconds) delays every response and STUB_FAILURE_RATE (0-1)
+answers a share of calls with a 429 or 503 so retries can be exercised.
+"""
+import asyncio
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+STUB_LATENCY = float(os.getenv("STUB_LATENCY", "0.5"))
+STUB_FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", "0"))
+STUB_QUESTIONS_PER_PAGE = int(os.getenv("STUB_QUESTIONS_PER_PAGE", "3"))
+
+app = FastAPI()
+
+stats = {"calls": 0, "failures": 0, "in_flight": 0, "max_in_flight": 0, "request_bytes": 0, "image_parts": 0}
+
+
+def fake_marking(call_id: int) -> str:
+    blocks = []
+    for q in range(1, STUB_QUESTIONS_PER_PAGE + 1):
+        blocks.append(
+            f"Question Number: {call_id}.{q}\n"
+            f"Question: Stub question {call_id}.{q}\n"
+            f"Max Marks: 2\n"
+            f"Student Answer:\nStub answer\n"
+            f"Mark: 1/2\n"
+            f"Comment: Stub comment"
+        )
+    return "---\n" + "\n---\n".join(blocks) + "\n---\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.body()
+    payload = await request.json()
+    stats["calls"] += 1
+    stats["request_bytes"] += len(body)
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            stats["image_parts"] += sum(1 for part in content if part.get("type") == "image_url")
+
+    call_id = stats["calls"]
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(STUB_LATENCY)
+    finally:
+        stats["in_flight"] -= 1
+
+    if random.random() < STUB_FAILURE_RATE:
+        stats["failures"] += 1
+        status = random.choice([429, 503])
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": "stub failure", "type": "stub", "code": status}},
+            headers={"retry-after": "0.1"},
+        )
+
+    text = fake_marking(call_id)
+    prompt_tokens = len(body) // 4
+    completion_tokens = len(text) // 4
+    return {
+        "id": f"chatcmpl-stub-{call_id}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "stub"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+@app.post("/stats/reset")
+def reset_stats():
+    for key in stats:
+        stats[key] = 0
+    return stats
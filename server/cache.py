@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def json_size(value: Any) -> int:
+    return len(json.dumps(value))
+
+
+class LRUCache:
+    """In-process LRU bounded by total value size, optionally backed by a directory.
+
+    Values must be JSON-serialisable when disk_dir is set; each disk entry is
+    stored as {"value": ..., "expires_at": ...}. With a ttl, entries in both
+    tiers expire that many seconds after being set. Disk entries are otherwise
+    never evicted here; clear the directory to reclaim space.
+    """
+
+    def __init__(self, name: str, max_bytes: int, disk_dir: Optional[str] = None, sizeof: Callable[[Any], int] = json_size, ttl: Optional[float] = None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[Any, int, Optional[float]]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        digest = content_hash(key.encode("utf-8"))
+        return os.path.join(self.disk_dir, digest[:2], f"{digest}.json")
+
+    def _store(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def _read_disk(self, key: str) -> tuple[Any, Optional[float]]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                stored = json.load(f)
+            written_at = os.path.getmtime(path)
+        except (OSError, ValueError):
+            return None, None
+        if isinstance(stored, dict) and set(stored) == {"value", "expires_at"}:
+            return stored["value"], stored["expires_at"]
+        # A bare value, written before entries were wrapped; it expires by its file's age
+        return stored, written_at + self.ttl if self.ttl else None
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[2] is None or entry[2] > now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._bytes -= self._entries.pop(key)[1]
+
+        if self.disk_dir:
+            value, expires_at = self._read_disk(key)
+            if value is not None and (expires_at is None or expires_at > now):
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._store(key, value, expires_at)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump({"value": value, "expires_at": expires_at}, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Could not write {self.name} cache entry: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from typing import Optional
+
+
+USAGE_CACHE_TTL = float(os.getenv("USAGE_CACHE_TTL", "5"))
+
+
+class CreditLimitError(Exception):
+    pass
+
+
+class FirestoreCreditStore:
+    """credits_used counters in the usage/{uid} documents."""
+
+    def __init__(self, db, collection: str = "usage"):
+        self.db = db
+        self.collection = collection
+
+    def read(self, uid: str) -> int:
+        doc = self.db.collection(self.collection).document(uid).get()
+        return doc.to_dict().get("credits_used", 0) if doc.exists else 0
+
+    def reserve(self, uid: str, count: int, max_credits: int) -> int:
+        from firebase_admin import firestore
+
+        ref = self.db.collection(self.collection).document(uid)
+
+        # The limit check and the increment commit together, so concurrent uploads can't both pass
+        @firestore.transactional
+        def reserve_in_transaction(transaction):
+            doc = ref.get(transaction=transaction)
+            used = doc.to_dict().get("credits_used", 0) if doc.exists else 0
+            if used + count > max_credits:
+                raise CreditLimitError(used)
+            transaction.set(ref, {"credits_used": used + count}, merge=True)
+            return used + count
+
+        return reserve_in_transaction(self.db.transaction())
+
+    def refund(self, uid: str, count: int):
+        from firebase_admin import firestore
+
+        self.db.collection(self.collection).document(uid).set({"credits_used": firestore.Increment(-count)}, merge=True)
+
+
+class InMemoryCreditStore:
+    """Process-local store for tests and benchmarks; latency simulates a Firestore round-trip."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.counters: dict[str, int] = {}
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def read(self, uid: str) -> int:
+        self._round_trip()
+        return self.counters.get(uid, 0)
+
+    def write(self, uid: str, used: int):
+        self._round_trip()
+        self.counters[uid] = used
+
+    def reserve(self, uid: str, count: int, max_credits: int) -> int:
+        # A Firestore transaction is a read plus a commit
+        self._round_trip()
+        with self._lock:
+            used = self.counters.get(uid, 0)
+            if used + count > max_credits:
+                raise CreditLimitError(used)
+            self.counters[uid] = used + count
+        self._round_trip()
+        return used + count
+
+    def refund(self, uid: str, count: int):
+        self._round_trip()
+        with self._lock:
+            self.counters[uid] = self.counters.get(uid, 0) - count
+
+
+class CreditLedger:
+    """Atomic credit reservation with a short-lived local cache of each user's usage."""
+
+    def __init__(self, store, ttl: float = USAGE_CACHE_TTL):
+        self.store = store
+        self.ttl = ttl
+        self._cache: dict[str, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, uid: str, used: int):
+        with self._lock:
+            self._cache[uid] = (used, time.time() + self.ttl)
+
+    def _cached(self, uid: str) -> Optional[int]:
+        with self._lock:
+            entry = self._cache.get(uid)
+            if entry and entry[1] > time.time():
+                return entry[0]
+            self._cache.pop(uid, None)
+            return None
+
+    def used(self, uid: str) -> int:
+        used = self._cached(uid)
+        if used is None:
+            used = self.store.read(uid)
+            self._remember(uid, used)
+        return used
+
+    def reserve(self, uid: str, max_credits: int, count: int = 1) -> int:
+        """Take `count` credits or raise CreditLimitError; returns credits used afterwards."""
+        try:
+            used = self.store.reserve(uid, count, max_credits)
+        except CreditLimitError as e:
+            self._remember(uid, e.args[0])
+            raise
+        self._remember(uid, used)
+        return used
+
+    def refund(self, uid: str, count: int = 1):
+        if count <= 0:
+            return
+        self.store.refund(uid, count)
+        with self._lock:
+            self._cache.pop(uid, None)
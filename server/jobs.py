@@ -0,0 +1,307 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "50"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(24 * 60 * 60)))
+
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class InMemoryJobBackend:
+    """Job records and payloads in process memory; jobs are lost on restart."""
+
+    durable = False
+
+    def __init__(self, max_queued: int = MAX_QUEUED_JOBS, ttl: int = JOB_TTL_SECONDS):
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queued)
+        self.jobs: dict[str, dict] = {}
+        self.payloads: dict[str, dict] = {}
+
+    async def enqueue(self, job: dict, payload: dict):
+        self._prune()
+        try:
+            self.queue.put_nowait(job["id"])
+        except asyncio.QueueFull:
+            raise QueueFullError()
+        self.jobs[job["id"]] = job
+        self.payloads[job["id"]] = payload
+
+    async def dequeue(self) -> str:
+        return await self.queue.get()
+
+    def drain(self) -> list[str]:
+        """Take every queued job id without waiting."""
+        job_ids = []
+        while not self.queue.empty():
+            job_ids.append(self.queue.get_nowait())
+        return job_ids
+
+    async def queued_count(self) -> int:
+        return self.queue.qsize()
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def update(self, job_id: str, expect: Optional[tuple] = None, **fields) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or (expect is not None and job["status"] not in expect):
+            return False
+        job.update(fields)
+        return True
+
+    async def get_payload(self, job_id: str) -> Optional[dict]:
+        return self.payloads.get(job_id)
+
+    async def delete_payload(self, job_id: str):
+        self.payloads.pop(job_id, None)
+
+    async def close(self):
+        pass
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job["status"] in FINISHED_STATUSES and (job.get("finishedAt") or 0) < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+
+class RedisJobBackend:
+    """Jobs shared through Redis, so several server processes can share one queue."""
+
+    QUEUE_KEY = "jobs:queue"
+    # Queued jobs outlive this process and are picked up by the next worker
+    durable = True
+
+    def __init__(self, redis_client, max_queued: int = MAX_QUEUED_JOBS, ttl: int = JOB_TTL_SECONDS):
+        self.redis = redis_client
+        self.max_queued = max_queued
+        self.ttl = ttl
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"jobs:{job_id}"
+
+    @staticmethod
+    def _payload_key(job_id: str) -> str:
+        return f"jobs:{job_id}:payload"
+
+    async def enqueue(self, job: dict, payload: dict):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._payload_key(job["id"]), mapping=payload)
+            pipe.expire(self._payload_key(job["id"]), self.ttl)
+            pipe.set(self._job_key(job["id"]), json.dumps(job), ex=self.ttl)
+            pipe.lpush(self.QUEUE_KEY, job["id"])
+            *_, queued = await pipe.execute()
+        if queued > self.max_queued:
+            # Lost the race for the last slot; take the job back out
+            await self.redis.lrem(self.QUEUE_KEY, 1, job["id"])
+            await self.redis.delete(self._job_key(job["id"]), self._payload_key(job["id"]))
+            raise QueueFullError()
+
+    async def dequeue(self) -> str:
+        while True:
+            item = await self.redis.brpop(self.QUEUE_KEY, timeout=1)
+            if item:
+                job_id = item[1]
+                return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+    async def queued_count(self) -> int:
+        return await self.redis.llen(self.QUEUE_KEY)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        raw = await self.redis.get(self._job_key(job_id))
+        return json.loads(raw) if raw else None
+
+    async def update(self, job_id: str, expect: Optional[tuple] = None, **fields) -> bool:
+        """Apply fields if the job exists and its status is in `expect`; True if applied.
+
+        The check and the write are one WATCH/MULTI transaction, so a cancel
+        from another process can't land between them.
+        """
+        from redis.exceptions import WatchError
+
+        key = self._job_key(job_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    raw = await pipe.get(key)
+                    job = json.loads(raw) if raw else None
+                    if job is None or (expect is not None and job["status"] not in expect):
+                        await pipe.unwatch()
+                        return False
+                    job.update(fields)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(job), ex=self.ttl)
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    async def get_payload(self, job_id: str) -> Optional[dict]:
+        payload = await self.redis.hgetall(self._payload_key(job_id))
+        if not payload:
+            return None
+        return {(k.decode() if isinstance(k, bytes) else k): v for k, v in payload.items()}
+
+    async def delete_payload(self, job_id: str):
+        await self.redis.delete(self._payload_key(job_id))
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def backend_from_env():
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        import redis.asyncio as redis
+
+        return RedisJobBackend(redis.from_url(redis_url))
+    return InMemoryJobBackend()
+
+
+JobHandler = Callable[[dict, dict], Awaitable[dict]]
+
+
+class JobQueue:
+    """Bounded queue of marking jobs drained by a fixed pool of async workers.
+
+    handler(job, payload) produces the result; on_abandon(job) runs when a
+    job fails or is cancelled after being accepted (used to refund credits).
+    Status changes go through backend.update(expect=...), so only one of
+    finishing, failing or cancelling a job ever wins.
+    """
+
+    def __init__(self, backend, handler: JobHandler, on_abandon: Callable[[dict], Awaitable[None]], workers: int = JOB_WORKERS):
+        self.backend = backend
+        self.handler = handler
+        self.on_abandon = on_abandon
+        self.workers = workers
+        self._worker_tasks: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+        self._stopping = False
+
+    async def start(self):
+        self._stopping = False
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers, failing and refunding the jobs they were running.
+
+        Jobs still queued in memory would be lost with the process, so they
+        are failed and refunded too.
+        """
+        self._stopping = True
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        if not self.backend.durable:
+            for job_id in self.backend.drain():
+                job = await self.backend.get(job_id)
+                if job:
+                    await self._abandon(job, "Server restarted before the job ran", expect=("queued",))
+        await self.backend.close()
+
+    async def is_full(self) -> bool:
+        return await self.backend.queued_count() >= self.backend.max_queued
+
+    async def submit(self, uid: str, payload: dict, **fields) -> dict:
+        job = {
+            "id": uuid.uuid4().hex,
+            "uid": uid,
+            "status": "queued",
+            "createdAt": time.time(),
+            "startedAt": None,
+            "finishedAt": None,
+            "error": None,
+            "result": None,
+            **fields,
+        }
+        await self.backend.enqueue(job, payload)
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.backend.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        job = await self.backend.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return job
+        if not await self.backend.update(job_id, expect=("queued", "running"), status="cancelled", finishedAt=time.time()):
+            # Finished while we looked
+            return await self.backend.get(job_id)
+        await self.backend.delete_payload(job_id)
+        task = self._running.get(job_id)
+        if task:
+            task.cancel()
+        await self.on_abandon(job)
+        return await self.backend.get(job_id)
+
+    async def _abandon(self, job: dict, error: str, expect: tuple):
+        # error is shown to the user, so it never carries exception text
+        if not await self.backend.update(job["id"], expect=expect, status="failed", error=error, finishedAt=time.time()):
+            # Already finished or cancelled, and refunded by whoever did that
+            return
+        try:
+            await self.on_abandon(job)
+        except Exception as e:
+            print(f"Could not abandon job {job['id']}: {e}")
+
+    async def _worker(self):
+        while True:
+            job_id = await self.backend.dequeue()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                # The worker is stopping; this job has left the queue and won't be picked up again
+                job = await self.backend.get(job_id)
+                if job:
+                    await self._abandon(job, "Server restarted before marking finished", expect=("queued", "running"))
+                raise
+
+    async def _run(self, job_id: str):
+        job = await self.backend.get(job_id)
+        # Cancelled while queued
+        if job is None or job["status"] != "queued":
+            return
+        payload = await self.backend.get_payload(job_id)
+        if payload is None:
+            return
+
+        if not await self.backend.update(job_id, expect=("queued",), status="running", startedAt=time.time()):
+            return
+        task = asyncio.create_task(self.handler(job, payload))
+        self._running[job_id] = task
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            # Awaiting the handler cancels it along with the worker; that's shutdown, not a DELETE
+            if self._stopping:
+                raise
+            # cancel() stopped the handler and has already recorded and refunded the job
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            # A cancel from another process can't interrupt the task, only mark the record
+            await self._abandon(job, "Marking failed", expect=("running",))
+        else:
+            await self.backend.update(job_id, expect=("running",), status="done", result=result, finishedAt=time.time())
+        finally:
+            self._running.pop(job_id, None)
+            await self.backend.delete_payload(job_id)
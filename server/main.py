@@ -1,16 +1,28 @@
 from fastapi import FastAPI, UploadFile, File, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from openai import OpenAI
-from pdf2image import convert_from_bytes
-from io import BytesIO
-from base64 import b64encode
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from typing import Optional
 import firebase_admin
 from firebase_admin import credentials, firestore, auth as admin_auth
 import os
 import json
 from dateutil.parser import parse
+from datetime import datetime, timezone
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from marking import MarkingOutputParser, mark_pages_as_completed, mark_scripts, mark_with_vision, marking_cache_context, parse_marking_output
+from batch import MAX_BATCH_SCRIPTS, BatchTooLargeError, class_aggregates, count_pdfs_in_zip, pdfs_from_zip
+from rendering import DEFAULT_RENDER_SETTINGS, PDFTooLargeError, pdf_to_base64_images, scheme_cache_key, scheme_page_cache, scheme_to_base64_images
+from jobs import JobQueue, QueueFullError, backend_from_env
+from auth_cache import TokenCache
+from cache import content_hash
+from credits import CreditLedger, CreditLimitError, FirestoreCreditStore
+from result_cache import page_result_cache, record_model_calls_avoided, result_cache_stats, script_result_cache, script_result_key
+from scheme_index import SCHEME_INDEX_ENABLED, get_scheme_index, page_question_numbers, scheme_index_cache
+from metrics import REQUEST_SECONDS, UPLOAD_BYTES, cache_collector, registry, server_timing_header, stage, start_request_timings
 
 
 app = FastAPI()
@@ -28,16 +40,31 @@ app.add_middleware(
 )
 
 
-firebase_config = json.loads(os.environ["FIREBASE_CONFIG_JSON"])
-cred = credentials.Certificate(firebase_config)
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred)
+def firestore_client():
+    """Firestore for the FIREBASE_CONFIG_JSON service account.
 
-db = firestore.client()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    A missing secret stops the server at import, unless FIREBASE_OPTIONAL=1:
+    benchmarks and local tooling set that and replace db, credit_ledger and
+    token_cache with their own fakes.
+    """
+    firebase_config = os.getenv("FIREBASE_CONFIG_JSON")
+    if not firebase_config:
+        if os.getenv("FIREBASE_OPTIONAL") != "1":
+            raise RuntimeError("FIREBASE_CONFIG_JSON is not set (set FIREBASE_OPTIONAL=1 to run without Firestore)")
+        print("FIREBASE_CONFIG_JSON is not set, Firestore is unavailable")
+        return None
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(json.loads(firebase_config)))
+    return firestore.client()
+
+db = firestore_client()
+token_cache = TokenCache(admin_auth.verify_id_token)
+credit_ledger = CreditLedger(FirestoreCreditStore(db))
 
 users_usage = {}
 
+registry.add_collector(cache_collector([scheme_page_cache, scheme_index_cache, script_result_cache, page_result_cache]))
+
 @app.get("/")
 def health():
     return {"status": "ok"}
@@ -54,175 +81,556 @@ async def verify_firebase_token(request: Request, call_next):
 
     id_token = auth_header[len("Bearer "):]
     try:
-        decoded_token = admin_auth.verify_id_token(id_token)
+        decoded_token = token_cache.get(id_token)
+        if decoded_token is None:
+            with stage("auth"):
+                decoded_token = await asyncio.to_thread(token_cache.verify, id_token)
         request.state.user = decoded_token["uid"]
     except Exception:
         return JSONResponse(status_code=401, content={"detail": "Invalid token"})
 
     return await call_next(request)
 
-
-
-
-
-def image_to_base64(img):
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    return b64encode(buffered.getvalue()).decode("utf-8")
-
-def pdf_to_base64_images(pdf_bytes: bytes):
-    images = convert_from_bytes(pdf_bytes)
-    return [image_to_base64(img) for img in images]
-
-def parse_marking_output(raw: str):
-    blocks = [b.strip() for b in raw.split("---") if b.strip()]
-    questions = []
-    total = ""
-
-    for block in blocks:
-        if block.lower().startswith("total marks"):
-            total = block.replace("Total Marks:", "").strip()
-            continue
-
-        q = {
-            "questionNumber": "",
-            "question": "",
-            "maxMarks": "",
-            "studentAnswer": "",
-            "mark": "",
-            "comment": ""
-        }
-
-        lines = block.split("\n")
-        current_key = None
-
-        for line in lines:
-            if line.startswith("Question Number:"):
-                q["questionNumber"] = line.replace("Question Number:", "").strip()
-            elif line.startswith("Question:"):
-                q["question"] = line.replace("Question:", "").strip()
-            elif line.startswith("Max Marks:"):
-                q["maxMarks"] = line.replace("Max Marks:", "").strip()
-            elif line.startswith("Student Answer:"):
-                current_key = "studentAnswer"
-                q["studentAnswer"] = ""
-            elif line.startswith("Mark:"):
-                q["mark"] = line.replace("Mark:", "").strip()
-                current_key = None
-            elif line.startswith("Comment:"):
-                current_key = "comment"
-                q["comment"] = line.replace("Comment:", "").strip()
-            elif current_key:
-                q[current_key] += " " + line.strip()
-
-        questions.append(q)
-
-    return {"questions": questions, "total": total}
-
-def mark_with_vision(student_images: list[str], scheme_images: list[str]) -> str:
-    results = []
-
-    scheme_blocks = [
-        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img}"}}
-        for img in scheme_images
-    ]
-
-    for i, student_img in enumerate(student_images):
-        print(f"Processing student page {i+1}...")
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """You are a professional GCSE Science examiner.
-
-You will be shown:
-- Multiple pages from a student's handwritten exam paper
-- Multiple pages from the official mark scheme
-
-Your task:
-1. Extract each exam question number
-2. Extract the student answer
-3. Match it with the correct part of the mark scheme
-4. Mark strictly using only allowed points
-5. Return each result in the format:
-
----
-
-Question Number: [e.g. 1.2 or 2(b)(ii)]  
-Question: [copied from student paper]  
-Max Marks: [e.g. 3]  
-Student Answer: [copied from paper]  
-Mark: X/Y  
-Comment: [examiner-style feedback]
-
----
-Total Marks: X/Y
-"""
-                        },
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{student_img}"}},
-                        *scheme_blocks
-                    ]
-                }
-            ],
-            max_tokens=1000
-        )
-
-        results.append(response.choices[0].message.content.strip())
-
-    return "\n\n".join(results)
-
-@app.post("/mark")
-async def mark_paper(request: Request, student: UploadFile = File(...), scheme: UploadFile = File(...)):
-    uid = request.state.user or f"anon:{request.client.host}"
-    max_credits = 10 if not uid.startswith("anon:") else 3
-
-    doc_ref = db.collection("usage").document(uid)
-    doc = doc_ref.get()
-
-    used = doc.to_dict().get("credits_used", 0) if doc.exists else 0
-
-    if used >= max_credits:
+# Registered after verify_firebase_token so it wraps it, and rejected requests are timed too
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    timings = start_request_timings()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    # Route templates rather than raw paths, so exam and job ids don't become labels
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(elapsed, method=request.method, path=route.path if route else "unmatched", status=response.status_code)
+    # Streamed responses only report the stages that finished before their headers went out
+    response.headers["Server-Timing"] = server_timing_header(timings + [("total", elapsed)])
+    return response
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(registry.expose(), media_type="text/plain; version=0.0.4")
+
+async def read_upload(upload: UploadFile) -> bytes:
+    with stage("upload_read"):
+        data = await upload.read()
+    UPLOAD_BYTES.inc(len(data))
+    return data
+
+# Credits per account, one per marked script; raise them where whole classes are marked
+USER_MAX_CREDITS = int(os.getenv("USER_MAX_CREDITS", "10"))
+ANON_MAX_CREDITS = int(os.getenv("ANON_MAX_CREDITS", "3"))
+
+async def reserve_credits(uid: str, count: int = 1) -> int:
+    """Atomically take credits for a marking request; returns credits used afterwards."""
+    max_credits = USER_MAX_CREDITS if not uid.startswith("anon:") else ANON_MAX_CREDITS
+    try:
+        with stage("credits"):
+            # A Firestore transaction is a few blocking round-trips, so keep it off the event loop
+            return await asyncio.to_thread(credit_ledger.reserve, uid, max_credits, count)
+    except CreditLimitError as e:
+        if count > 1:
+            remaining = max(0, max_credits - e.args[0])
+            raise HTTPException(
+                status_code=429,
+                detail=f"This batch needs {count} credits but only {remaining} of your {max_credits} are left; upload fewer scripts",
+            )
         raise HTTPException(status_code=429, detail="Credit limit reached")
-    
-    # Increment credit usage in Firestore
-    doc_ref.set({"credits_used": used + 1}, merge=True)
 
-    # Convert PDFs
-    student_bytes = await student.read()
-    scheme_bytes = await scheme.read()
+async def refund_credit(uid: str, count: int = 1):
+    with stage("credits"):
+        await asyncio.to_thread(credit_ledger.refund, uid, count)
+
+async def read_credits_used(uid: str) -> int:
+    # Usually answered from the ledger's cache, but a miss reads Firestore
+    return await asyncio.to_thread(credit_ledger.used, uid)
+
+async def render_pdf(pdf_bytes: bytes, executor=None) -> list[str]:
+    if executor is None:
+        return await asyncio.to_thread(pdf_to_base64_images, pdf_bytes)
+    # Stages recorded inside worker processes don't reach this process's metrics
+    with stage("render_process"):
+        return await asyncio.get_running_loop().run_in_executor(executor, pdf_to_base64_images, pdf_bytes)
+
+async def render_scheme(scheme_bytes: bytes, executor=None) -> list[str]:
+    if executor is None:
+        return await asyncio.to_thread(scheme_to_base64_images, scheme_bytes)
+    # The cache lives in this process, so look it up here rather than in the worker
+    key = scheme_cache_key(scheme_bytes)
+    pages = scheme_page_cache.get(key)
+    if pages is None:
+        pages = await render_pdf(scheme_bytes, executor)
+        scheme_page_cache.set(key, pages)
+    return pages
+
+def scheme_cache_context(scheme_bytes: bytes) -> str:
+    return marking_cache_context(content_hash(scheme_bytes), DEFAULT_RENDER_SETTINGS.key(), SCHEME_INDEX_ENABLED)
+
+def cached_script_result(cache_context: str, student_bytes: bytes) -> Optional[str]:
+    cached = script_result_cache.get(script_result_key(cache_context, student_bytes))
+    if cached is None:
+        return None
+    record_model_calls_avoided(cached["modelCalls"])
+    return cached["raw"]
+
+def remember_script_result(cache_context: str, student_bytes: bytes, raw_result: str, pages: int):
+    if raw_result.strip():
+        # At least one model call per page
+        script_result_cache.set(script_result_key(cache_context, student_bytes), {"raw": raw_result, "modelCalls": pages})
+
+async def prepare_marking_inputs(
+    student_bytes: bytes,
+    scheme_bytes: bytes,
+    executor=None,
+    cache_context: Optional[str] = None,
+    read_cache: bool = True,
+) -> dict:
+    """Rendered pages and scheme index, as keyword arguments for mark_with_vision.
+
+    Rendering runs in threads by default, or in the given process pool.
+    """
+    try:
+        student_images, scheme_images = await asyncio.gather(
+            render_pdf(student_bytes, executor),
+            render_scheme(scheme_bytes, executor),
+        )
+    except PDFTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    scheme_index, page_questions = None, None
+    if SCHEME_INDEX_ENABLED:
+        scheme_index, page_questions = await asyncio.gather(
+            asyncio.to_thread(get_scheme_index, scheme_bytes),
+            asyncio.to_thread(page_question_numbers, student_bytes),
+        )
 
-    student_images = pdf_to_base64_images(student_bytes)
-    scheme_images = pdf_to_base64_images(scheme_bytes)
+    return {
+        "student_images": student_images,
+        "scheme_images": scheme_images,
+        "scheme_index": scheme_index,
+        "page_questions": page_questions,
+        "cache_context": cache_context,
+        "read_cache": read_cache,
+    }
 
-    raw_result = mark_with_vision(student_images, scheme_images)
-    parsed = parse_marking_output(raw_result)
-    parsed["credits_used"] = used + 1
+def exam_summary(parsed: dict) -> dict:
+    # Stored next to the full result so the history list can skip the questions
+    return {"total": parsed.get("total", ""), "questionCount": len(parsed.get("questions", []))}
+
+def normalize_timestamp(ts) -> datetime:
+    """Older exam documents hold timestamps as strings or {"seconds": ...} dicts."""
+    # Firestore timestamp object
+    if isinstance(ts, datetime):
+        return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    # Dict with seconds
+    if isinstance(ts, dict) and "seconds" in ts:
+        return datetime.fromtimestamp(ts["seconds"], tz=timezone.utc)
+    # String
+    try:
+        parsed = parse(ts)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    except Exception:
+        return datetime.fromtimestamp(0, tz=timezone.utc)
 
-    # Save exam result to Firestore
+def exam_document(uid: str, parsed: dict, student_filename: str, scheme_filename: str):
     exam_data = {
         "timestamp": firestore.SERVER_TIMESTAMP,
         "result": parsed,
-        "studentFileName": student.filename,
-        "schemeFileName": scheme.filename
+        "summary": exam_summary(parsed),
+        "studentFileName": student_filename,
+        "schemeFileName": scheme_filename
     }
 
     if uid.startswith("anon:"):
         # Store in anonymous collection with IP as identifier
         exam_ref = db.collection("anonymous_exams").document()
         exam_data["ip"] = uid.split(":")[1]  # Store IP for later matching
-        exam_ref.set(exam_data)
     else:
         # Store in regular exams collection for logged-in users
         exam_ref = db.collection("exams").document()
         exam_data["userId"] = uid
+
+    return exam_ref, exam_data
+
+def save_exam(uid: str, parsed: dict, student_filename: str, scheme_filename: str):
+    # Save exam result to Firestore
+    exam_ref, exam_data = exam_document(uid, parsed, student_filename, scheme_filename)
+    with stage("firestore_write"):
         exam_ref.set(exam_data)
 
+# Firestore allows 500 writes per batch, but full results are large, so stay well under the 10MB request cap
+FIRESTORE_BATCH_SIZE = 50
+
+def save_exams(uid: str, exams: list[tuple[dict, str, str]]):
+    """Save up to FIRESTORE_BATCH_SIZE (parsed, student_filename, scheme_filename) results in one commit."""
+    if len(exams) > FIRESTORE_BATCH_SIZE:
+        raise ValueError(f"At most {FIRESTORE_BATCH_SIZE} exams per commit")
+    batch = db.batch()
+    for parsed, student_filename, scheme_filename in exams:
+        exam_ref, exam_data = exam_document(uid, parsed, student_filename, scheme_filename)
+        batch.set(exam_ref, exam_data)
+    with stage("firestore_write"):
+        batch.commit()
+
+@app.post("/mark")
+async def mark_paper(request: Request, student: UploadFile = File(...), scheme: UploadFile = File(...), bypass_cache: bool = False):
+    uid = request.state.user or f"anon:{request.client.host}"
+
+    student_bytes = await read_upload(student)
+    scheme_bytes = await read_upload(scheme)
+    cache_context = scheme_cache_context(scheme_bytes)
+
+    # An identical resubmission is answered from the cache without spending a credit
+    raw_result = None if bypass_cache else cached_script_result(cache_context, student_bytes)
+    if raw_result is not None:
+        parsed = parse_marking_output(raw_result)
+        parsed["credits_used"] = await read_credits_used(uid)
+        save_exam(uid, parsed, student.filename, scheme.filename)
+        return parsed
+
+    used = await reserve_credits(uid)
+
+    try:
+        # Convert PDFs
+        inputs = await prepare_marking_inputs(student_bytes, scheme_bytes, cache_context=cache_context, read_cache=not bypass_cache)
+
+        raw_result = await mark_with_vision(**inputs)
+        remember_script_result(cache_context, student_bytes, raw_result, len(inputs["student_images"]))
+        parsed = parse_marking_output(raw_result)
+        parsed["credits_used"] = used
+
+        save_exam(uid, parsed, student.filename, scheme.filename)
+    except BaseException:
+        await refund_credit(uid)
+        raise
+
+    return parsed
+
+# Student PDFs of a batch rendered at once
+BATCH_RENDER_CONCURRENCY = int(os.getenv("BATCH_RENDER_CONCURRENCY", "4"))
+# Scripts marked together; the next chunk renders while this one is marked, so at
+# most two chunks of rendered pages are in memory however large the class is
+BATCH_CHUNK_SCRIPTS = int(os.getenv("BATCH_CHUNK_SCRIPTS", "8"))
+
+@app.post("/mark-batch")
+async def mark_batch(
+    request: Request,
+    scheme: UploadFile = File(...),
+    students: Optional[list[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    bypass_cache: bool = False,
+):
+    """Mark a class of scripts against one mark scheme.
+
+    Scripts come as repeated `students` files and/or a zip `archive` of PDFs.
+    Each script costs one credit; scripts that fail are refunded. The whole
+    batch must fit in the account's remaining credits.
+    """
+    uid = request.state.user or f"anon:{request.client.host}"
+
+    scripts = [(s.filename, await read_upload(s)) for s in students or []]
+    archive_bytes = await read_upload(archive) if archive is not None else None
+    script_count = len(scripts)
+    if archive_bytes is not None:
+        # Only the zip's directory is read here; nothing is inflated until the credits are reserved
+        try:
+            script_count += count_pdfs_in_zip(archive_bytes)
+        except BatchTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if not script_count:
+        raise HTTPException(status_code=400, detail="No student scripts uploaded")
+    if script_count > MAX_BATCH_SCRIPTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SCRIPTS} scripts per batch")
+
+    render_semaphore = asyncio.Semaphore(BATCH_RENDER_CONCURRENCY)
+
+    async def prepare_script(student_bytes: bytes) -> dict:
+        async with render_semaphore:
+            student_images = await render_pdf(student_bytes)
+        page_questions = await asyncio.to_thread(page_question_numbers, student_bytes) if scheme_index else None
+        return {"student_images": student_images, "page_questions": page_questions}
+
+    async def prepare_chunk(chunk: list[tuple[str, bytes]]) -> list:
+        return await asyncio.gather(*(prepare_script(b) for _, b in chunk), return_exceptions=True)
+
+    async def mark_chunk(prepared: list) -> list:
+        renderable = [i for i, p in enumerate(prepared) if not isinstance(p, BaseException)]
+        marked = await mark_scripts(
+            [prepared[i] for i in renderable],
+            scheme_images,
+            scheme_index=scheme_index,
+            cache_context=scheme_cache_context(scheme_bytes),
+            read_cache=not bypass_cache,
+        )
+        outcomes = list(prepared)
+        for i, raw in zip(renderable, marked):
+            outcomes[i] = raw
+        return outcomes
+
+    used = await reserve_credits(uid, count=script_count)
+    # Credits not yet spent on a saved exam or refunded; given back if anything below fails
+    outstanding = script_count
+
+    try:
+        if archive_bytes is not None:
+            try:
+                scripts += await asyncio.to_thread(pdfs_from_zip, archive_bytes)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        # The scheme is rendered and indexed once for the whole class
+        scheme_bytes = await read_upload(scheme)
+        try:
+            scheme_images = await render_scheme(scheme_bytes)
+        except PDFTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        scheme_index = await asyncio.to_thread(get_scheme_index, scheme_bytes) if SCHEME_INDEX_ENABLED else None
+
+        chunks = [scripts[i:i + BATCH_CHUNK_SCRIPTS] for i in range(0, len(scripts), BATCH_CHUNK_SCRIPTS)]
+        outcomes = []
+        next_chunk = asyncio.ensure_future(prepare_chunk(chunks[0]))
+        try:
+            for i in range(len(chunks)):
+                prepared = await next_chunk
+                next_chunk = asyncio.ensure_future(prepare_chunk(chunks[i + 1])) if i + 1 < len(chunks) else None
+                outcomes += await mark_chunk(prepared)
+        finally:
+            if next_chunk:
+                next_chunk.cancel()
+
+        results, saved, failed = [], [], 0
+        for (filename, _), outcome in zip(scripts, outcomes):
+            if isinstance(outcome, BaseException):
+                failed += 1
+                detail = str(outcome) if isinstance(outcome, PDFTooLargeError) else "Marking failed"
+                print(f"Batch script {filename} failed: {outcome}")
+                results.append({"studentFileName": filename, "error": detail})
+                continue
+            parsed = parse_marking_output(outcome)
+            saved.append((parsed, filename, scheme.filename))
+            results.append({"studentFileName": filename, **parsed})
+
+        if failed:
+            await refund_credit(uid, count=failed)
+            outstanding -= failed
+        # One commit per call, so exams already committed stay paid for if a later commit fails
+        for start in range(0, len(saved), FIRESTORE_BATCH_SIZE):
+            chunk = saved[start:start + FIRESTORE_BATCH_SIZE]
+            save_exams(uid, chunk)
+            outstanding -= len(chunk)
+    except BaseException:
+        if outstanding:
+            await refund_credit(uid, count=outstanding)
+        raise
+
+    return {
+        "results": results,
+        "aggregates": class_aggregates([parsed for parsed, _, _ in saved]),
+        "credits_used": used - failed,
+    }
+
+def ndjson_line(event: dict) -> str:
+    return json.dumps(event) + "\n"
+
+class SettledStreamingResponse(StreamingResponse):
+    """StreamingResponse that awaits `settle()` once it has been sent or abandoned.
+
+    A body generator's own finally never runs if the client leaves before the
+    body starts, so cleanup that must always happen goes in `settle` instead.
+    """
+    def __init__(self, content, settle, **kwargs):
+        super().__init__(content, **kwargs)
+        self.settle = settle
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            await self.settle()
+
+@app.post("/mark-stream")
+async def mark_paper_stream(request: Request, student: UploadFile = File(...), scheme: UploadFile = File(...), bypass_cache: bool = False):
+    """Same as /mark, but streams NDJSON events while pages are marked.
+
+    Events: start (page count), question (one parsed block, with its page),
+    progress (pages done), then result (the /mark response) or error.
+    A cached result is sent straight away as its questions and the result.
+    """
+    uid = request.state.user or f"anon:{request.client.host}"
+
+    student_bytes = await read_upload(student)
+    scheme_bytes = await read_upload(scheme)
+    cache_context = scheme_cache_context(scheme_bytes)
+    student_filename, scheme_filename = student.filename, scheme.filename
+
+    raw_result = None if bypass_cache else cached_script_result(cache_context, student_bytes)
+    if raw_result is not None:
+        parsed = parse_marking_output(raw_result)
+        parsed["credits_used"] = await read_credits_used(uid)
+        save_exam(uid, parsed, student_filename, scheme_filename)
+
+        async def cached_events():
+            for question in parsed["questions"]:
+                yield ndjson_line({"type": "question", "page": None, "question": question})
+            yield ndjson_line({"type": "result", **parsed})
+
+        return StreamingResponse(cached_events(), media_type="application/x-ndjson")
+
+    used = await reserve_credits(uid)
+
+    try:
+        inputs = await prepare_marking_inputs(student_bytes, scheme_bytes, cache_context=cache_context, read_cache=not bypass_cache)
+    except BaseException:
+        await refund_credit(uid)
+        raise
+
+    page_count = len(inputs["student_images"])
+    saved = False
+
+    async def events():
+        nonlocal saved
+        yield ndjson_line({"type": "start", "pages": page_count})
+
+        results = [""] * page_count
+        pages_done = 0
+        try:
+            async for i, raw in mark_pages_as_completed(**inputs):
+                results[i] = raw
+                parser = MarkingOutputParser()
+                for question in parser.feed(raw) + parser.close():
+                    yield ndjson_line({"type": "question", "page": i + 1, "question": question})
+                pages_done += 1
+                yield ndjson_line({"type": "progress", "pagesDone": pages_done, "pages": page_count})
+
+            # Final result is assembled in page order, exactly as /mark returns it
+            raw_result = "\n\n".join(results)
+            remember_script_result(cache_context, student_bytes, raw_result, page_count)
+            parsed = parse_marking_output(raw_result)
+            parsed["credits_used"] = used
+            save_exam(uid, parsed, student_filename, scheme_filename)
+            saved = True
+            yield ndjson_line({"type": "result", **parsed})
+        except Exception as e:
+            print(f"Streaming marking failed: {e}")
+            yield ndjson_line({"type": "error", "detail": "Marking failed"})
+
+    async def settle():
+        # Failed, or the client went away before (or without) the exam being saved
+        if not saved:
+            await refund_credit(uid)
+
+    return SettledStreamingResponse(events(), settle, media_type="application/x-ndjson")
+
+render_pool: Optional[ProcessPoolExecutor] = None
+
+async def run_marking_job(job: dict, payload: dict) -> dict:
+    cache_context = scheme_cache_context(payload["scheme"])
+    read_cache = not job.get("bypassCache")
+    credits_used = job["creditsUsed"]
+
+    raw_result = cached_script_result(cache_context, payload["student"]) if read_cache else None
+    cached = raw_result is not None
+    if cached:
+        # The credit was taken at submission; a cached result doesn't need it
+        credits_used -= 1
+    else:
+        inputs = await prepare_marking_inputs(payload["student"], payload["scheme"], executor=render_pool, cache_context=cache_context, read_cache=read_cache)
+        raw_result = await mark_with_vision(**inputs)
+        remember_script_result(cache_context, payload["student"], raw_result, len(inputs["student_images"]))
+
+    parsed = parse_marking_output(raw_result)
+    parsed["credits_used"] = credits_used
+    save_exam(job["uid"], parsed, job["studentFileName"], job["schemeFileName"])
+    if cached:
+        # Only once saved: if anything before this fails, the job's abandon refund gives the credit back
+        await refund_credit(job["uid"])
     return parsed
 
+async def refund_job(job: dict):
+    await refund_credit(job["uid"])
+
+job_queue = JobQueue(backend_from_env(), run_marking_job, refund_job)
+
+@app.on_event("startup")
+async def start_job_workers():
+    global render_pool
+    render_pool = ProcessPoolExecutor(
+        max_workers=int(os.getenv("RENDER_PROCESSES", "2")),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_queue.stop()
+    if render_pool:
+        render_pool.shutdown(cancel_futures=True)
+
+def job_response(job: dict) -> dict:
+    response = {
+        "jobId": job["id"],
+        "status": job["status"],
+        "createdAt": job["createdAt"],
+        "startedAt": job["startedAt"],
+        "finishedAt": job["finishedAt"],
+    }
+    if job["status"] == "failed":
+        response["error"] = job["error"]
+    return response
+
+async def get_own_job(request: Request, job_id: str) -> dict:
+    job = await job_queue.get(job_id)
+    if not job or job["uid"] != request.state.user:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs", status_code=202)
+async def submit_marking_job(request: Request, student: UploadFile = File(...), scheme: UploadFile = File(...), bypass_cache: bool = False):
+    uid = request.state.user or f"anon:{request.client.host}"
+
+    # Fail fast before reading the uploads or charging a credit
+    if await job_queue.is_full():
+        raise HTTPException(status_code=503, detail="Marking queue is full, try again shortly", headers={"Retry-After": "30"})
+
+    student_bytes = await read_upload(student)
+    scheme_bytes = await read_upload(scheme)
+
+    used = await reserve_credits(uid)
+    try:
+        job = await job_queue.submit(
+            uid,
+            {"student": student_bytes, "scheme": scheme_bytes},
+            creditsUsed=used,
+            bypassCache=bypass_cache,
+            studentFileName=student.filename,
+            schemeFileName=scheme.filename,
+        )
+    except QueueFullError:
+        await refund_credit(uid)
+        raise HTTPException(status_code=503, detail="Marking queue is full, try again shortly", headers={"Retry-After": "30"})
+
+    return job_response(job)
+
+@app.get("/jobs/{job_id}")
+async def get_marking_job(request: Request, job_id: str):
+    job = await get_own_job(request, job_id)
+    return job_response(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_marking_job_result(request: Request, job_id: str):
+    job = await get_own_job(request, job_id)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job["result"]
+
+@app.delete("/jobs/{job_id}")
+async def cancel_marking_job(request: Request, job_id: str):
+    await get_own_job(request, job_id)
+    job = await job_queue.cancel(job_id)
+    return job_response(job)
+
 @app.post("/link-anonymous-papers")
 async def link_anonymous_papers(request: Request):
     uid = request.state.user
@@ -241,6 +649,8 @@ async def link_anonymous_papers(request: Request):
         # Create new exam document in user's collection
         new_exam_ref = db.collection("exams").document()
         exam_data["userId"] = uid
+        exam_data["timestamp"] = normalize_timestamp(exam_data.get("timestamp"))
+        exam_data.setdefault("summary", exam_summary(exam_data.get("result", {})))
         new_exam_ref.set(exam_data)
         # Delete the anonymous exam
         exam.reference.delete()
@@ -250,35 +660,72 @@ async def link_anonymous_papers(request: Request):
 @app.get("/usage")
 async def get_usage(request: Request):
     uid = request.state.user or request.client.host
-    doc_ref = db.collection("usage").document(uid)
-    doc = doc_ref.get()
-    used = doc.to_dict().get("credits_used", 0) if doc.exists else 0
-    return {"credits_used": used}
+    return {"credits_used": await read_credits_used(uid)}
+
+@app.get("/cache-stats")
+def get_cache_stats():
+    return {
+        "scheme_pages": scheme_page_cache.stats(),
+        "scheme_index": scheme_index_cache.stats(),
+        "tokens": token_cache.stats(),
+        "results": result_cache_stats(),
+    }
+
+EXAMS_PAGE_SIZE = 20
+EXAMS_MAX_PAGE_SIZE = 100
+EXAM_SUMMARY_FIELDS = ["timestamp", "studentFileName", "schemeFileName", "summary"]
 
 @app.get("/exams")
-async def get_user_exams(request: Request):
+async def get_user_exams(request: Request, limit: int = EXAMS_PAGE_SIZE, cursor: Optional[str] = None):
+    """Newest-first page of exam summaries; pass nextCursor back as cursor for the next page.
+
+    Needs the composite index exams(userId ASC, timestamp DESC).
+    """
     uid = request.state.user
     if not uid or uid.startswith("anon:"):
         raise HTTPException(status_code=401, detail="Authentication required")
-    
-    exams_ref = db.collection("exams").where("userId", "==", uid)
-    exams = exams_ref.get()
-    
-    exam_list = [{"id": exam.id, **exam.to_dict()} for exam in exams]
-
-    def get_timestamp_seconds(ts):
-        # Firestore timestamp object
-        if hasattr(ts, 'timestamp'):
-            return ts.timestamp()
-        # Dict with seconds
-        if isinstance(ts, dict) and 'seconds' in ts:
-            return ts['seconds']
-        # String
-        try:
-            return parse(ts).timestamp()
-        except Exception:
-            return 0
 
-    exam_list.sort(key=lambda x: get_timestamp_seconds(x.get("timestamp")), reverse=True)
-    
-    return exam_list
\ No newline at end of file
+    limit = max(1, min(limit, EXAMS_MAX_PAGE_SIZE))
+    query = (
+        db.collection("exams")
+        .where("userId", "==", uid)
+        .order_by("timestamp", direction=firestore.Query.DESCENDING)
+        .select(EXAM_SUMMARY_FIELDS)
+    )
+
+    if cursor:
+        # Only the fields the cursor and the owner check need, not the full result
+        cursor_doc = db.collection("exams").document(cursor).get(field_paths=["userId", "timestamp"])
+        if not cursor_doc.exists or cursor_doc.to_dict().get("userId") != uid:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.start_after(cursor_doc)
+
+    # One extra row tells us whether there is another page
+    exams = query.limit(limit + 1).get()
+    next_cursor = exams[limit - 1].id if len(exams) > limit else None
+
+    exam_list = []
+    for exam in exams[:limit]:
+        data = exam.to_dict()
+        exam_list.append({
+            "id": exam.id,
+            "timestamp": data.get("timestamp"),
+            "studentFileName": data.get("studentFileName"),
+            "schemeFileName": data.get("schemeFileName"),
+            "total": data.get("summary", {}).get("total", ""),
+        })
+
+    return {"exams": exam_list, "nextCursor": next_cursor}
+
+@app.get("/exams/{exam_id}")
+async def get_user_exam(request: Request, exam_id: str):
+    uid = request.state.user
+    if not uid or uid.startswith("anon:"):
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    exam = db.collection("exams").document(exam_id).get()
+    exam_data = exam.to_dict() if exam.exists else None
+    if not exam_data or exam_data.get("userId") != uid:
+        raise HTTPException(status_code=404, detail="Exam not found")
+
+    return {"id": exam.id, **exam_data}
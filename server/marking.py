@@ -0,0 +1,376 @@
+import asyncio
+import os
+import random
+from typing import Optional
+
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, RateLimitError
+
+from rendering import DEFAULT_RENDER_SETTINGS
+from scheme_index import parse_question_numbers, scheme_excerpt
+from result_cache import page_result_cache, page_result_key, record_model_calls_avoided
+from metrics import MODEL_CALLS, MODEL_TOKENS, PAGES_MARKED, stage
+
+
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
+# Bump whenever MARKING_PROMPT or the way scheme content is attached changes, so cached results are not reused
+PROMPT_VERSION = "1"
+
+# Pages of one script marked at once, and model calls in flight across all requests
+MAX_CONCURRENT_PAGES = int(os.getenv("MAX_CONCURRENT_PAGES", "4"))
+MAX_CONCURRENT_MODEL_CALLS = int(os.getenv("MAX_CONCURRENT_MODEL_CALLS", "16"))
+# Pages of a whole batch marked at once, shared by all scripts in it
+MAX_CONCURRENT_BATCH_PAGES = int(os.getenv("MAX_CONCURRENT_BATCH_PAGES", "8"))
+
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+MODEL_RETRY_BASE_DELAY = float(os.getenv("MODEL_RETRY_BASE_DELAY", "0.5"))
+MODEL_RETRY_MAX_DELAY = float(os.getenv("MODEL_RETRY_MAX_DELAY", "20"))
+
+# OPENAI_BASE_URL points the client at a local stub (see benchmarks/stub_openai.py)
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=os.getenv("OPENAI_BASE_URL") or None,
+    max_retries=0,
+)
+
+model_semaphore = asyncio.Semaphore(MAX_CONCURRENT_MODEL_CALLS)
+
+MARKING_PROMPT = """You are a professional GCSE Science examiner.
+
+You will be shown:
+- Multiple pages from a student's handwritten exam paper
+- Multiple pages from the official mark scheme
+
+Your task:
+1. Extract each exam question number
+2. Extract the student answer
+3. Match it with the correct part of the mark scheme
+4. Mark strictly using only allowed points
+5. Return each result in the format:
+
+---
+
+Question Number: [e.g. 1.2 or 2(b)(ii)]  
+Question: [copied from student paper]  
+Max Marks: [e.g. 3]  
+Student Answer: [copied from paper]  
+Mark: X/Y  
+Comment: [examiner-style feedback]
+
+---
+Total Marks: X/Y
+"""
+
+DETECT_QUESTIONS_PROMPT = """This is one page of a student's exam paper.
+List the exam question numbers that appear on it, including an answer continued from an earlier page.
+Reply with top-level question numbers only, comma separated (e.g. "3, 4"), or NONE.
+"""
+
+
+def parse_question_block(block: str) -> dict:
+    q = {
+        "questionNumber": "",
+        "question": "",
+        "maxMarks": "",
+        "studentAnswer": "",
+        "mark": "",
+        "comment": ""
+    }
+
+    lines = block.split("\n")
+    current_key = None
+
+    for line in lines:
+        if line.startswith("Question Number:"):
+            q["questionNumber"] = line.replace("Question Number:", "").strip()
+        elif line.startswith("Question:"):
+            q["question"] = line.replace("Question:", "").strip()
+        elif line.startswith("Max Marks:"):
+            q["maxMarks"] = line.replace("Max Marks:", "").strip()
+        elif line.startswith("Student Answer:"):
+            current_key = "studentAnswer"
+            q["studentAnswer"] = ""
+        elif line.startswith("Mark:"):
+            q["mark"] = line.replace("Mark:", "").strip()
+            current_key = None
+        elif line.startswith("Comment:"):
+            current_key = "comment"
+            q["comment"] = line.replace("Comment:", "").strip()
+        elif current_key:
+            q[current_key] += " " + line.strip()
+
+    return q
+
+
+class MarkingOutputParser:
+    """Incremental parse_marking_output.
+
+    feed() accepts model output in arbitrary chunks and returns the question
+    blocks completed so far; close() flushes the last block. The latest
+    "Total Marks" block is kept in .total.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.total = ""
+
+    def feed(self, chunk: str) -> list[dict]:
+        self.buffer += chunk
+        *complete, self.buffer = self.buffer.split("---")
+        return self._parse_blocks(complete)
+
+    def close(self) -> list[dict]:
+        remaining, self.buffer = self.buffer, ""
+        return self._parse_blocks([remaining])
+
+    def _parse_blocks(self, blocks: list[str]) -> list[dict]:
+        questions = []
+        for block in blocks:
+            block = block.strip()
+            if not block:
+                continue
+            if block.lower().startswith("total marks"):
+                self.total = block.replace("Total Marks:", "").strip()
+                continue
+            questions.append(parse_question_block(block))
+        return questions
+
+
+def parse_marking_output(raw: str):
+    with stage("parse"):
+        parser = MarkingOutputParser()
+        questions = parser.feed(raw) + parser.close()
+    return {"questions": questions, "total": parser.total}
+
+
+def marking_cache_context(scheme_hash: str, render_key: str, scheme_index_enabled: bool) -> str:
+    """Everything besides the student input that decides what the model is asked."""
+    return f"{MODEL}:{PROMPT_VERSION}:{scheme_hash}:{render_key}:{int(scheme_index_enabled)}"
+
+
+def _is_retryable(exc: Exception) -> bool:
+    # A 429 for an exhausted quota won't clear by waiting
+    if isinstance(exc, RateLimitError):
+        return getattr(exc, "code", None) != "insufficient_quota"
+    if isinstance(exc, APIConnectionError):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code >= 500
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), MODEL_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    delay = MODEL_RETRY_BASE_DELAY * (2 ** attempt)
+    return min(delay, MODEL_RETRY_MAX_DELAY) * random.uniform(0.5, 1.0)
+
+
+async def complete_with_retry(content: list[dict], max_tokens: int = 1000) -> str:
+    """Single chat completion under the global concurrency limit, retried on 429/5xx."""
+    attempt = 0
+    while True:
+        try:
+            async with model_semaphore:
+                with stage("model_call"):
+                    response = await client.chat.completions.create(
+                        model=MODEL,
+                        messages=[{"role": "user", "content": content}],
+                        max_tokens=max_tokens
+                    )
+            MODEL_CALLS.inc(outcome="ok")
+            if response.usage:
+                MODEL_TOKENS.inc(response.usage.prompt_tokens, kind="prompt")
+                MODEL_TOKENS.inc(response.usage.completion_tokens, kind="completion")
+            return (response.choices[0].message.content or "").strip()
+        except Exception as exc:
+            if attempt >= MODEL_MAX_RETRIES or not _is_retryable(exc):
+                MODEL_CALLS.inc(outcome="error")
+                raise
+            MODEL_CALLS.inc(outcome="retried")
+            delay = _retry_delay(exc, attempt)
+            print(f"Model call failed ({exc.__class__.__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def image_block(img: str, mime_type: str = DEFAULT_RENDER_SETTINGS.mime_type) -> dict:
+    return {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{img}"}}
+
+
+async def detect_page_questions(student_block: dict) -> list[str]:
+    # A low-detail image is enough to read printed question numbers
+    low_detail = {"type": "image_url", "image_url": {**student_block["image_url"], "detail": "low"}}
+    raw = await complete_with_retry([{"type": "text", "text": DETECT_QUESTIONS_PROMPT}, low_detail], max_tokens=20)
+    return parse_question_numbers(raw)
+
+
+async def mark_page(page_number: int, student_block: dict, scheme_content: list[dict]) -> str:
+    print(f"Processing student page {page_number}...")
+    return await complete_with_retry([
+        {"type": "text", "text": MARKING_PROMPT},
+        student_block,
+        *scheme_content
+    ])
+
+
+def _page_coroutines(
+    student_images: list[str],
+    scheme_images: list[str],
+    max_concurrency: int,
+    mime_type: str,
+    scheme_index: Optional[dict],
+    page_questions: Optional[list[list[str]]],
+    semaphore: Optional[asyncio.Semaphore] = None,
+    cache_context: Optional[str] = None,
+    read_cache: bool = True,
+) -> list:
+    scheme_blocks = [image_block(img, mime_type) for img in scheme_images]
+
+    request_semaphore = semaphore or asyncio.Semaphore(max(1, max_concurrency))
+
+    async def scheme_for_page(i: int, student_block: dict) -> list[dict]:
+        if not scheme_index or not scheme_index.get("questions"):
+            return scheme_blocks
+        questions = page_questions[i] if page_questions and i < len(page_questions) else []
+        if not questions:
+            questions = await detect_page_questions(student_block)
+        excerpt = scheme_excerpt(scheme_index, questions)
+        if excerpt is None:
+            return scheme_blocks
+        return [{"type": "text", "text": f"Mark scheme for question(s) {', '.join(questions)}:\n\n{excerpt}"}]
+
+    async def run(i: int, student_img: str) -> str:
+        key = page_result_key(cache_context, student_img) if cache_context else None
+        if key and read_cache:
+            cached = page_result_cache.get(key)
+            if cached is not None:
+                record_model_calls_avoided(1)
+                PAGES_MARKED.inc(source="cache")
+                return cached
+
+        async with request_semaphore:
+            student_block = image_block(student_img, mime_type)
+            scheme_content = await scheme_for_page(i, student_block)
+            raw = await mark_page(i + 1, student_block, scheme_content)
+
+        PAGES_MARKED.inc(source="model")
+        if key and raw:
+            page_result_cache.set(key, raw)
+        return raw
+
+    return [run(i, img) for i, img in enumerate(student_images)]
+
+
+async def mark_with_vision(
+    student_images: list[str],
+    scheme_images: list[str],
+    max_concurrency: int = MAX_CONCURRENT_PAGES,
+    mime_type: str = DEFAULT_RENDER_SETTINGS.mime_type,
+    scheme_index: Optional[dict] = None,
+    page_questions: Optional[list[list[str]]] = None,
+    cache_context: Optional[str] = None,
+    read_cache: bool = True,
+) -> str:
+    """Mark every student page and join the raw outputs in page order.
+
+    With a scheme_index, each page only carries the scheme text for the
+    questions on it: taken from page_questions when the script has a text
+    layer, otherwise detected with a cheap low-detail call. Pages whose
+    questions can't be matched fall back to all scheme page images.
+
+    With a cache_context (see marking_cache_context) each page's output is
+    memoized; read_cache=False re-marks every page and refreshes the cache.
+    """
+    coroutines = _page_coroutines(
+        student_images, scheme_images, max_concurrency, mime_type, scheme_index, page_questions,
+        cache_context=cache_context, read_cache=read_cache,
+    )
+
+    # gather keeps results in page order regardless of completion order
+    tasks = [asyncio.ensure_future(c) for c in coroutines]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # One page failed (or the request went away): stop the others calling the model
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return "\n\n".join(results)
+
+
+async def mark_pages_as_completed(
+    student_images: list[str],
+    scheme_images: list[str],
+    max_concurrency: int = MAX_CONCURRENT_PAGES,
+    mime_type: str = DEFAULT_RENDER_SETTINGS.mime_type,
+    scheme_index: Optional[dict] = None,
+    page_questions: Optional[list[list[str]]] = None,
+    cache_context: Optional[str] = None,
+    read_cache: bool = True,
+):
+    """Like mark_with_vision, but yields (page_index, raw_output) as each page finishes.
+
+    Closing the generator early cancels the pages still in flight.
+    """
+    coroutines = _page_coroutines(
+        student_images, scheme_images, max_concurrency, mime_type, scheme_index, page_questions,
+        cache_context=cache_context, read_cache=read_cache,
+    )
+
+    async def indexed(i: int, coroutine) -> tuple[int, str]:
+        return i, await coroutine
+
+    tasks = [asyncio.ensure_future(indexed(i, c)) for i, c in enumerate(coroutines)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def mark_scripts(
+    scripts: list[dict],
+    scheme_images: list[str],
+    scheme_index: Optional[dict] = None,
+    max_concurrency: int = MAX_CONCURRENT_BATCH_PAGES,
+    mime_type: str = DEFAULT_RENDER_SETTINGS.mime_type,
+    cache_context: Optional[str] = None,
+    read_cache: bool = True,
+) -> list:
+    """Mark several scripts against one scheme under a shared page budget.
+
+    scripts are {"student_images": [...], "page_questions": [...]} dicts.
+    Pages are queued round-robin (page 1 of every script, then page 2, ...)
+    so a long script can't starve the others. Returns each script's joined
+    raw output in input order, or the exception that failed it.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    per_script = [
+        _page_coroutines(
+            script["student_images"], scheme_images, max_concurrency, mime_type, scheme_index, script.get("page_questions"),
+            semaphore=semaphore, cache_context=cache_context, read_cache=read_cache,
+        )
+        for script in scripts
+    ]
+
+    # Tasks reach the semaphore in creation order and it wakes waiters FIFO
+    tasks: list[list[asyncio.Task]] = [[] for _ in per_script]
+    for page in range(max((len(c) for c in per_script), default=0)):
+        for script_tasks, coroutines in zip(tasks, per_script):
+            if page < len(coroutines):
+                script_tasks.append(asyncio.ensure_future(coroutines[page]))
+
+    async def collect(script_tasks: list[asyncio.Task]) -> str:
+        try:
+            return "\n\n".join(await asyncio.gather(*script_tasks))
+        except BaseException:
+            for task in script_tasks:
+                task.cancel()
+            raise
+
+    return await asyncio.gather(*(collect(t) for t in tasks), return_exceptions=True)
@@ -0,0 +1,164 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> (per-bucket counts, sum, count)
+        self._series: dict[tuple, tuple[list[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            counts, total, count = self._series.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[key] = (counts, total + value, count + 1)
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + (bound,))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: list[Callable[[], list[str]]] = []
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = STAGE_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect: Callable[[], list[str]]):
+        """Extra lines computed at scrape time, e.g. from cache stats."""
+        self._collectors.append(collect)
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collect in self._collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram("marking_stage_seconds", "Time spent in each marking pipeline stage", ("stage",))
+REQUEST_SECONDS = registry.histogram("http_request_seconds", "HTTP request latency until response headers", ("method", "path", "status"))
+UPLOAD_BYTES = registry.counter("upload_bytes_total", "Bytes of uploaded PDFs read")
+PAGES_RENDERED = registry.counter("pages_rendered_total", "PDF pages rasterized")
+ENCODED_IMAGE_BYTES = registry.counter("encoded_image_bytes_total", "Base64 bytes of rendered page images")
+MODEL_CALLS = registry.counter("model_calls_total", "Chat completion calls by outcome", ("outcome",))
+MODEL_TOKENS = registry.counter("model_tokens_total", "Tokens reported by the model API", ("kind",))
+PAGES_MARKED = registry.counter("pages_marked_total", "Student pages marked, by source", ("source",))
+
+_request_timings: ContextVar[Optional[list]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage into STAGE_SECONDS and the current request's Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def start_request_timings() -> list:
+    timings: list = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: list) -> str:
+    # Stages that ran several times (e.g. one model call per page) are summed
+    totals: dict[str, tuple[float, int]] = {}
+    for name, elapsed in timings:
+        total, count = totals.get(name, (0.0, 0))
+        totals[name] = (total + elapsed, count + 1)
+    return ", ".join(
+        f'{name};dur={total * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+        for name, (total, count) in totals.items()
+    )
+
+
+def cache_collector(caches: list) -> Callable[[], list[str]]:
+    """Scrape-time counters from LRUCache.stats() for the given caches."""
+    def collect() -> list[str]:
+        lines = []
+        for metric, stat, help in (
+            ("cache_hits_total", "hits", "Memory-tier cache hits"),
+            ("cache_disk_hits_total", "disk_hits", "Disk-tier cache hits"),
+            ("cache_misses_total", "misses", "Cache misses"),
+            ("cache_evictions_total", "evictions", "Cache evictions"),
+        ):
+            lines += [f"# HELP {metric} {help}", f"# TYPE {metric} counter"]
+            for cache in caches:
+                lines.append(f"{metric}{_format_labels(('cache',), (cache.name,))} {cache.stats()[stat]}")
+        lines += ["# HELP cache_bytes Bytes held in memory by each cache", "# TYPE cache_bytes gauge"]
+        for cache in caches:
+            lines.append(f"cache_bytes{_format_labels(('cache',), (cache.name,))} {cache.stats()['bytes']}")
+        return lines
+    return collect
@@ -0,0 +1,194 @@
+import math
+import os
+import re
+import tempfile
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import dataclass
+from io import BytesIO
+from itertools import groupby
+from typing import Optional
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from cache import LRUCache, content_hash
+from metrics import ENCODED_IMAGE_BYTES, PAGES_RENDERED, stage
+
+
+class PDFTooLargeError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class RenderSettings:
+    dpi: int = 150
+    mode: str = "grayscale"  # rgb | grayscale | bilevel
+    format: str = "jpeg"  # jpeg | webp | png
+    quality: int = 80
+    max_edge: int = 2000
+    max_pages: int = 40
+    max_page_pixels: int = 16_000_000
+    window: int = 2
+    threads: int = 2
+
+    @property
+    def image_format(self) -> str:
+        # 1-bit images only stay small (and valid) as PNG
+        return "png" if self.mode == "bilevel" else self.format
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.image_format}"
+
+    def key(self) -> str:
+        return f"{self.dpi}:{self.mode}:{self.image_format}:{self.quality}:{self.max_edge}:{self.max_page_pixels}"
+
+
+DEFAULT_RENDER_SETTINGS = RenderSettings(
+    dpi=int(os.getenv("RENDER_DPI", "150")),
+    mode=os.getenv("RENDER_MODE", "grayscale"),
+    format=os.getenv("RENDER_FORMAT", "jpeg"),
+    quality=int(os.getenv("RENDER_QUALITY", "80")),
+    max_edge=int(os.getenv("RENDER_MAX_EDGE", "2000")),
+    max_pages=int(os.getenv("MAX_PDF_PAGES", "40")),
+    max_page_pixels=int(os.getenv("MAX_PAGE_PIXELS", "16000000")),
+    window=int(os.getenv("RENDER_WINDOW", "2")),
+    threads=int(os.getenv("RENDER_THREADS", "2")),
+)
+
+# Mark schemes are shared by a whole class, so their rendered pages are kept by content hash
+scheme_page_cache = LRUCache(
+    "scheme pages",
+    max_bytes=int(os.getenv("SCHEME_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    disk_dir=os.getenv("SCHEME_CACHE_DIR") or None,
+    sizeof=lambda pages: sum(len(p) for p in pages),
+)
+
+BILEVEL_THRESHOLD = 160
+
+PAGE_SIZE_PATTERN = re.compile(r"([\d.]+)\s*x\s*([\d.]+)\s*pts")
+# pdfinfo run with -f/-l prints "Page    3 size: 595 x 842 pts (A4)" for each page
+PAGE_SIZE_KEY = re.compile(r"^Page\s+(\d+)\s+size$")
+MIN_RENDER_DPI = 36
+
+
+def image_to_base64(img, settings: RenderSettings = DEFAULT_RENDER_SETTINGS):
+    if settings.max_edge and max(img.size) > settings.max_edge:
+        img.thumbnail((settings.max_edge, settings.max_edge))
+
+    if settings.mode == "bilevel":
+        img = img.convert("L").point(lambda p: 255 if p > BILEVEL_THRESHOLD else 0, mode="1")
+    elif settings.mode == "grayscale" and img.mode != "L":
+        img = img.convert("L")
+    elif settings.mode == "rgb" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    buffered = BytesIO()
+    fmt = settings.image_format
+    if fmt == "jpeg":
+        img.save(buffered, format="JPEG", quality=settings.quality, optimize=True)
+    elif fmt == "webp":
+        img.save(buffered, format="WEBP", quality=settings.quality, method=4)
+    else:
+        img.save(buffered, format="PNG", optimize=True)
+    return b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def page_sizes(info: dict) -> dict[int, tuple[float, float]]:
+    """Page number -> (width, height) in inches from pdfinfo output."""
+    sizes = {}
+    for key, value in info.items():
+        key_match = PAGE_SIZE_KEY.match(key)
+        size_match = PAGE_SIZE_PATTERN.search(str(value))
+        if key_match and size_match:
+            sizes[int(key_match.group(1))] = (float(size_match.group(1)) / 72, float(size_match.group(2)) / 72)
+    return sizes
+
+
+def effective_dpi(size: Optional[tuple[float, float]], settings: RenderSettings) -> int:
+    """DPI at which a page of `size` inches stays within max_page_pixels and max_edge.
+
+    Poppler renders straight at this DPI, so an oversized page never gets
+    rasterized at full resolution first.
+    """
+    if size is None:
+        return settings.dpi
+    width_in, height_in = size
+    dpi = settings.dpi
+    if width_in * height_in * dpi ** 2 > settings.max_page_pixels:
+        dpi = int(math.sqrt(settings.max_page_pixels / (width_in * height_in)))
+        if dpi < MIN_RENDER_DPI:
+            raise PDFTooLargeError(f"Page is {width_in:.0f}x{height_in:.0f} inches, too large to render")
+    if settings.max_edge:
+        dpi = min(dpi, max(1, int(settings.max_edge / max(width_in, height_in))))
+    return dpi
+
+
+def pdf_to_base64_images(pdf_bytes: bytes, settings: RenderSettings = DEFAULT_RENDER_SETTINGS) -> list[str]:
+    """Render and encode a PDF a few pages at a time.
+
+    Only `threads` windows of `window` pages are held as PIL images at once;
+    everything else is already encoded.
+    """
+    # pdf2image copies bytes to a fresh temp file on every call; write it once for pdfinfo and all the windows
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+        pdf_file.write(pdf_bytes)
+        pdf_file.flush()
+        return _render_pdf_file(pdf_file.name, settings)
+
+
+def _render_pdf_file(pdf_path: str, settings: RenderSettings) -> list[str]:
+    # Sizes of every page (not just the first), so each one gets its own DPI
+    info = pdfinfo_from_path(pdf_path, first_page=1, last_page=settings.max_pages + 1)
+    page_count = int(info["Pages"])
+    if page_count > settings.max_pages:
+        raise PDFTooLargeError(f"PDF has {page_count} pages, the limit is {settings.max_pages}")
+
+    sizes = page_sizes(info)
+    page_dpi = {page: effective_dpi(sizes.get(page), settings) for page in range(1, page_count + 1)}
+    window = max(1, settings.window)
+
+    def render_window(first_page: int) -> list[str]:
+        last_page = min(first_page + window - 1, page_count)
+        encoded = []
+        # Consecutive pages at the same DPI go to poppler in one call
+        for dpi, group in groupby(range(first_page, last_page + 1), key=page_dpi.get):
+            pages = list(group)
+            with stage("rasterize"):
+                images = convert_from_path(
+                    pdf_path,
+                    dpi=dpi,
+                    first_page=pages[0],
+                    last_page=pages[-1],
+                    grayscale=settings.mode != "rgb",
+                )
+            for img in images:
+                # Only reachable when pdfinfo didn't report the page's size
+                if img.width * img.height > settings.max_page_pixels:
+                    raise PDFTooLargeError(f"Page is {img.width}x{img.height}, the limit is {settings.max_page_pixels} pixels")
+                with stage("encode"):
+                    encoded.append(image_to_base64(img, settings))
+                img.close()
+        PAGES_RENDERED.inc(len(encoded))
+        ENCODED_IMAGE_BYTES.inc(sum(len(page) for page in encoded))
+        return encoded
+
+    starts = range(1, page_count + 1, window)
+    with ThreadPoolExecutor(max_workers=max(1, settings.threads)) as executor:
+        # Each window runs in a copy of the caller's context so its stages reach Server-Timing
+        futures = [executor.submit(copy_context().run, render_window, start) for start in starts]
+        return [page for future in futures for page in future.result()]
+
+
+def scheme_cache_key(pdf_bytes: bytes, settings: RenderSettings = DEFAULT_RENDER_SETTINGS) -> str:
+    return f"{content_hash(pdf_bytes)}:{settings.key()}"
+
+
+def scheme_to_base64_images(pdf_bytes: bytes, settings: RenderSettings = DEFAULT_RENDER_SETTINGS) -> list[str]:
+    key = scheme_cache_key(pdf_bytes, settings)
+    pages = scheme_page_cache.get(key)
+    if pages is None:
+        pages = pdf_to_base64_images(pdf_bytes, settings)
+        scheme_page_cache.set(key, pages)
+    return pages
@@ -0,0 +1,49 @@
+import os
+import threading
+
+from cache import LRUCache, content_hash
+
+
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 60 * 60)))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR") or None
+
+# Whole-script outputs: {"raw": joined model output, "modelCalls": calls it took}
+script_result_cache = LRUCache(
+    "script results",
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    disk_dir=os.path.join(RESULT_CACHE_DIR, "scripts") if RESULT_CACHE_DIR else None,
+    ttl=RESULT_CACHE_TTL,
+)
+
+# Raw model output for one student page against one scheme
+page_result_cache = LRUCache(
+    "page results",
+    max_bytes=int(os.getenv("PAGE_RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    disk_dir=os.path.join(RESULT_CACHE_DIR, "pages") if RESULT_CACHE_DIR else None,
+    ttl=RESULT_CACHE_TTL,
+)
+
+_avoided_lock = threading.Lock()
+model_calls_avoided = 0
+
+
+def script_result_key(context: str, student_bytes: bytes) -> str:
+    return content_hash(f"{context}:{content_hash(student_bytes)}".encode("utf-8"))
+
+
+def page_result_key(context: str, student_img: str) -> str:
+    return content_hash(f"{context}:{content_hash(student_img.encode('utf-8'))}".encode("utf-8"))
+
+
+def record_model_calls_avoided(count: int):
+    global model_calls_avoided
+    with _avoided_lock:
+        model_calls_avoided += count
+
+
+def result_cache_stats() -> dict:
+    return {
+        "scripts": script_result_cache.stats(),
+        "pages": page_result_cache.stats(),
+        "model_calls_avoided": model_calls_avoided,
+    }
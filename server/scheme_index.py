@@ -0,0 +1,177 @@
+import os
+import re
+from io import BytesIO
+from typing import Optional
+
+from cache import LRUCache, content_hash
+from metrics import stage
+
+
+# "01.2", "2(b)(ii)", "1 (a)", "Q3" or "Question 4". Bare numbers ("3 marks", page
+# footers) are deliberately not treated as anchors.
+QUESTION_ANCHOR_PATTERN = re.compile(
+    r"^\s*(?:Q(?:uestion)?\.?\s*(?P<pnum>\d{1,2})"
+    r"|(?P<num>\d{1,2})(?:\.(?P<part>\d{1,2})|(?P<sub>(?:\s?\([a-z]{1,4}\))+)))(?=\s|$)",
+    re.IGNORECASE,
+)
+SUB_PART_PATTERN = re.compile(r"\(([a-z]{1,4})\)", re.IGNORECASE)
+# Largest forward step between consecutive anchors; bigger jumps are numbers inside answers
+MAX_QUESTION_STEP = 2
+# Sub-parts a new question can open with ("04.1", "4(a)", "4(i)"); None is a bare "Q4"
+FIRST_PARTS = {None, "1", "a", "i"}
+DETECTED_QUESTIONS_PATTERN = re.compile(r"\d{1,2}")
+
+SCHEME_INDEX_ENABLED = os.getenv("SCHEME_INDEX_ENABLED", "1") != "0"
+
+MIN_INDEX_TEXT_CHARS = 200
+
+scheme_index_cache = LRUCache(
+    "scheme index",
+    max_bytes=int(os.getenv("SCHEME_INDEX_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    disk_dir=os.path.join(os.environ["SCHEME_CACHE_DIR"], "index") if os.getenv("SCHEME_CACHE_DIR") else None,
+)
+
+
+def question_anchor_parts(line: str) -> Optional[tuple[str, Optional[str]]]:
+    """Question number and first sub-part a line starts, e.g. "01.2 ..." -> ("1", "2")."""
+    match = QUESTION_ANCHOR_PATTERN.match(line)
+    if not match:
+        return None
+    if match.group("pnum"):
+        return str(int(match.group("pnum"))), None
+    if match.group("part"):
+        return str(int(match.group("num"))), str(int(match.group("part")))
+    return str(int(match.group("num"))), SUB_PART_PATTERN.search(match.group("sub")).group(1).lower()
+
+
+def question_anchor(line: str) -> Optional[str]:
+    """Top-level question number a line starts, e.g. "01.2 ..." -> "1"."""
+    parts = question_anchor_parts(line)
+    return parts[0] if parts else None
+
+
+def parse_question_numbers(raw: str) -> list[str]:
+    """Question numbers from a free-text model reply like "1, 2 and 3"."""
+    if "none" in raw.lower():
+        return []
+    return sorted({str(int(n)) for n in DETECTED_QUESTIONS_PATTERN.findall(raw)}, key=int)
+
+
+def _page_lines(pdf_bytes: bytes) -> list[list[str]]:
+    import pdfplumber
+
+    with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
+        return [(page.extract_text() or "").splitlines() for page in pdf.pages]
+
+
+def _opens_question(current: Optional[str], number: str, part: Optional[str]) -> bool:
+    # Questions only move forward in small steps and start at their first sub-part,
+    # so "4.2 V" inside an answer to 03.1 is not question 4
+    if part not in FIRST_PARTS:
+        return False
+    return current is None or 0 < int(number) - int(current) <= MAX_QUESTION_STEP
+
+
+def build_scheme_index(pdf_bytes: bytes) -> dict:
+    """Split a mark scheme's text layer into per-question segments.
+
+    Returns {"questions": {"1": {"text": ..., "pages": [...]}}, "page_count": n}.
+    "questions" is empty when the scheme has no usable text layer (scans),
+    in which case callers fall back to sending the page images.
+    """
+    return index_scheme_lines(_page_lines(pdf_bytes))
+
+
+def index_scheme_lines(pages: list[list[str]]) -> dict:
+    """build_scheme_index for text already split into lines per page.
+
+    The index is also left empty when it looks inconsistent: the next
+    sub-part of an earlier question (03.2 after 04.1) means some lines were
+    filed under the wrong question.
+    """
+    questions: dict[str, dict] = {}
+    # Highest numbered sub-part seen for each question, e.g. {"3": 1} after "03.1"
+    numbered_parts: dict[str, int] = {}
+    current = None
+
+    for page_number, lines in enumerate(pages):
+        for line in lines:
+            anchor = question_anchor_parts(line)
+            if anchor:
+                number, part = anchor
+                if number == current or _opens_question(current, number, part):
+                    current = number
+                    if part and part.isdigit():
+                        numbered_parts[number] = max(numbered_parts.get(number, 0), int(part))
+                elif number in numbered_parts and part and part.isdigit() and int(part) == numbered_parts[number] + 1:
+                    print(f"Mark scheme index is inconsistent at {line.strip()!r}, sending scheme pages instead")
+                    return {"questions": {}, "page_count": len(pages)}
+            if current is None:
+                continue
+            segment = questions.setdefault(current, {"lines": [], "pages": []})
+            segment["lines"].append(line)
+            if page_number not in segment["pages"]:
+                segment["pages"].append(page_number)
+
+    text_chars = sum(len(line) for segment in questions.values() for line in segment["lines"])
+    if text_chars < MIN_INDEX_TEXT_CHARS:
+        questions = {}
+
+    return {
+        "questions": {
+            q: {"text": "\n".join(segment["lines"]).strip(), "pages": segment["pages"]}
+            for q, segment in questions.items()
+        },
+        "page_count": len(pages),
+    }
+
+
+def get_scheme_index(pdf_bytes: bytes) -> dict:
+    key = content_hash(pdf_bytes)
+    index = scheme_index_cache.get(key)
+    if index is None:
+        try:
+            with stage("scheme_index"):
+                index = build_scheme_index(pdf_bytes)
+        except Exception as e:
+            print(f"Could not index mark scheme: {e}")
+            index = {"questions": {}, "page_count": 0}
+        scheme_index_cache.set(key, index)
+    return index
+
+
+def page_question_numbers(pdf_bytes: bytes) -> list[list[str]]:
+    """Questions found on each page of a script's text layer.
+
+    Text before a page's first anchor continues the previous page's last
+    question. Pages without text (scans) get an empty list.
+    """
+    try:
+        with stage("text_layer"):
+            pages = _page_lines(pdf_bytes)
+    except Exception:
+        return []
+
+    result = []
+    last_question = None
+    for lines in pages:
+        text_lines = [line for line in lines if line.strip()]
+        found = []
+        if text_lines and last_question and not question_anchor(text_lines[0]):
+            found.append(last_question)
+        for line in text_lines:
+            anchor = question_anchor(line)
+            if anchor and anchor not in found:
+                found.append(anchor)
+        result.append(found)
+        if found:
+            last_question = found[-1]
+    return result
+
+
+def scheme_excerpt(index: dict, questions: list[str]) -> Optional[str]:
+    """Scheme text for the given questions, or None if any of them is not indexed."""
+    segments = index.get("questions", {})
+    if not questions or any(q not in segments for q in questions):
+        return None
+    return "\n\n".join(segments[q]["text"] for q in sorted(set(questions), key=int))
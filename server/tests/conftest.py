@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server runs with server/ as its app dir, so its modules import each other top-level
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import pytest
+
+import auth_cache
+from auth_cache import TokenCache
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth_cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+class Verifier:
+    def __init__(self, clock: Clock, lifetime: float = 3600):
+        self.clock = clock
+        self.lifetime = lifetime
+        self.calls: list[str] = []
+
+    def __call__(self, token: str) -> dict:
+        self.calls.append(token)
+        return {"uid": token, "exp": self.clock.now + self.lifetime}
+
+
+def test_repeated_token_is_verified_once(clock):
+    verify = Verifier(clock)
+    cache = TokenCache(verify)
+    assert cache.verify("a") == cache.verify("a")
+    assert verify.calls == ["a"]
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_entry_expires_at_token_exp(clock):
+    verify = Verifier(clock, lifetime=600)
+    cache = TokenCache(verify, max_ttl=3600)
+    cache.verify("a")
+    clock.now += 599
+    assert cache.get("a") is not None
+    clock.now += 1
+    assert cache.get("a") is None
+    cache.verify("a")
+    assert verify.calls == ["a", "a"]
+
+
+def test_max_ttl_caps_long_lived_tokens(clock):
+    verify = Verifier(clock, lifetime=3600)
+    cache = TokenCache(verify, max_ttl=60)
+    cache.verify("a")
+    clock.now += 59
+    assert cache.get("a") is not None
+    clock.now += 1
+    assert cache.get("a") is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    verify = Verifier(clock)
+    cache = TokenCache(verify, max_entries=2)
+    cache.verify("a")
+    cache.verify("b")
+    # Touching "a" leaves "b" as the oldest
+    cache.verify("a")
+    cache.verify("c")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["entries"] == 2
+
+
+def test_failed_verification_is_not_cached(clock):
+    calls = []
+
+    def verify(token: str) -> dict:
+        calls.append(token)
+        raise ValueError("expired")
+
+    cache = TokenCache(verify)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.verify("a")
+    assert calls == ["a", "a"]
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,48 @@
+import zipfile
+from io import BytesIO
+
+import pytest
+
+import batch
+from batch import BatchTooLargeError, count_pdfs_in_zip, pdfs_from_zip
+
+
+def make_zip(files: dict) -> bytes:
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+ARCHIVE = make_zip({
+    "class/b.pdf": b"%PDF b",
+    "class/a.PDF": b"%PDF a",
+    "class/notes.txt": b"not a script",
+    "class/.hidden.pdf": b"%PDF hidden",
+    "__MACOSX/class/._a.pdf": b"resource fork",
+})
+
+
+def test_count_matches_extracted_pdfs():
+    assert count_pdfs_in_zip(ARCHIVE) == 2
+    assert pdfs_from_zip(ARCHIVE) == [("a.PDF", b"%PDF a"), ("b.pdf", b"%PDF b")]
+
+
+def test_oversized_archive_is_refused_from_its_directory(monkeypatch):
+    monkeypatch.setattr(batch, "MAX_BATCH_ARCHIVE_BYTES", 1024)
+    bomb = make_zip({"big.pdf": b"\0" * 1_000_000})
+    assert len(bomb) < 10_000
+    with pytest.raises(BatchTooLargeError):
+        count_pdfs_in_zip(bomb)
+
+
+def test_too_many_pdfs_are_refused(monkeypatch):
+    monkeypatch.setattr(batch, "MAX_BATCH_SCRIPTS", 1)
+    with pytest.raises(BatchTooLargeError):
+        count_pdfs_in_zip(ARCHIVE)
+
+
+def test_not_a_zip():
+    with pytest.raises(ValueError):
+        count_pdfs_in_zip(b"%PDF-1.4 not a zip")
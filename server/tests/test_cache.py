@@ -0,0 +1,116 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import cache
+from cache import LRUCache
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+def sized(value: str) -> int:
+    return len(value)
+
+
+def test_least_recently_used_entries_are_evicted_by_size():
+    lru = LRUCache("test", max_bytes=10, sizeof=sized)
+    lru.set("a", "aaaa")
+    lru.set("b", "bbbb")
+    # Touching "a" leaves "b" as the oldest
+    assert lru.get("a") == "aaaa"
+    lru.set("c", "cccc")
+    assert lru.get("b") is None
+    assert lru.get("a") == "aaaa"
+    assert lru.get("c") == "cccc"
+    stats = lru.stats()
+    assert (stats["bytes"], stats["entries"], stats["evictions"]) == (8, 2, 1)
+
+
+def test_replacing_a_key_reclaims_its_bytes():
+    lru = LRUCache("test", max_bytes=10, sizeof=sized)
+    lru.set("a", "aaaaaaaa")
+    lru.set("a", "aa")
+    assert lru.stats()["bytes"] == 2
+
+
+def test_value_larger_than_the_cache_is_not_kept():
+    lru = LRUCache("test", max_bytes=4, sizeof=sized)
+    lru.set("a", "aaa")
+    lru.set("big", "bbbbbbbb")
+    assert lru.get("big") is None
+    assert lru.get("a") == "aaa"
+
+
+def test_disk_round_trip_survives_a_new_process(tmp_path):
+    LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path)).set("key", {"questions": [1, 2], "total": "3/4"})
+    fresh = LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path))
+    assert fresh.get("key") == {"questions": [1, 2], "total": "3/4"}
+    assert fresh.get("key") == {"questions": [1, 2], "total": "3/4"}
+    stats = fresh.stats()
+    assert (stats["disk_hits"], stats["hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_entries_are_always_wrapped_on_disk(tmp_path):
+    lru = LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path))
+    # A value that looks like the wrapper must still come back as itself
+    value = {"value": "x", "expires_at": 5}
+    lru.set("key", value)
+    with open(lru._disk_path("key")) as f:
+        assert json.load(f) == {"value": value, "expires_at": None}
+    assert LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path)).get("key") == value
+
+
+def test_memory_entries_expire_after_ttl(clock):
+    lru = LRUCache("test", max_bytes=1024, ttl=60)
+    lru.set("key", "value")
+    clock.now += 59
+    assert lru.get("key") == "value"
+    clock.now += 1
+    assert lru.get("key") is None
+    assert lru.stats()["bytes"] == 0
+
+
+def test_disk_entries_expire_after_ttl(tmp_path, clock):
+    LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path), ttl=60).set("key", "value")
+    clock.now += 59
+    assert LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path), ttl=60).get("key") == "value"
+    clock.now += 1
+    assert LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path), ttl=60).get("key") is None
+
+
+def test_entry_promoted_from_disk_keeps_its_expiry(tmp_path, clock):
+    LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path), ttl=60).set("key", "value")
+    fresh = LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path), ttl=60)
+    clock.now += 30
+    assert fresh.get("key") == "value"
+    clock.now += 30
+    assert fresh.get("key") is None
+
+
+def test_legacy_bare_values_are_read_and_expire_by_file_age(tmp_path, clock):
+    lru = LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path), ttl=60)
+    path = lru._disk_path("key")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(["page1", "page2"], f)
+    os.utime(path, (clock.now, clock.now))
+    assert lru.get("key") == ["page1", "page2"]
+
+    clock.now += 60
+    assert LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path), ttl=60).get("key") is None
+    assert LRUCache("test", max_bytes=1024, disk_dir=str(tmp_path)).get("key") == ["page1", "page2"]
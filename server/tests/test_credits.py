@@ -0,0 +1,78 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.fake_firestore import FakeAborted, FakeFirestore, fake_transactional
+from credits import CreditLedger, CreditLimitError, FirestoreCreditStore, InMemoryCreditStore
+
+MAX_CREDITS = 10
+
+
+@pytest.fixture
+def firestore_store(monkeypatch):
+    firestore = pytest.importorskip("firebase_admin.firestore")
+    monkeypatch.setattr(firestore, "transactional", fake_transactional)
+    # Latency widens the gap between each transaction's read and its commit
+    return FirestoreCreditStore(FakeFirestore(latency=0.002))
+
+
+def reserve_concurrently(store, uploads: int) -> list[bool]:
+    start = threading.Barrier(uploads)
+
+    def upload(_) -> bool:
+        start.wait()
+        try:
+            store.reserve("teacher", 1, MAX_CREDITS)
+            return True
+        except CreditLimitError:
+            return False
+
+    with ThreadPoolExecutor(max_workers=uploads) as pool:
+        return list(pool.map(upload, range(uploads)))
+
+
+def test_concurrent_reserves_never_overshoot_the_limit(firestore_store):
+    accepted = reserve_concurrently(firestore_store, 25)
+    assert sum(accepted) == MAX_CREDITS
+    assert firestore_store.read("teacher") == MAX_CREDITS
+
+
+def test_reserve_reports_usage_when_refused(firestore_store):
+    firestore_store.reserve("teacher", MAX_CREDITS - 1, MAX_CREDITS)
+    with pytest.raises(CreditLimitError) as refused:
+        firestore_store.reserve("teacher", 2, MAX_CREDITS)
+    assert refused.value.args[0] == MAX_CREDITS - 1
+    assert firestore_store.read("teacher") == MAX_CREDITS - 1
+
+
+def test_refund_gives_credits_back(firestore_store):
+    firestore_store.reserve("teacher", 3, MAX_CREDITS)
+    firestore_store.refund("teacher", 2)
+    assert firestore_store.read("teacher") == 1
+
+
+def test_fake_transaction_aborts_on_a_stale_read():
+    pytest.importorskip("firebase_admin")
+    db = FakeFirestore()
+    ref = db.collection("usage").document("teacher")
+    first, second = db.transaction(), db.transaction()
+    ref.get(transaction=first)
+    ref.get(transaction=second)
+    second.set(ref, {"credits_used": 1})
+    second.commit()
+    first.set(ref, {"credits_used": 1})
+    with pytest.raises(FakeAborted):
+        first.commit()
+
+
+def test_ledger_caches_usage_until_a_refund():
+    store = InMemoryCreditStore()
+    ledger = CreditLedger(store, ttl=60)
+    assert ledger.reserve("teacher", MAX_CREDITS, count=2) == 2
+    reads = store.round_trips
+    assert ledger.used("teacher") == 2
+    assert store.round_trips == reads
+    ledger.refund("teacher")
+    assert ledger.used("teacher") == 1
+    assert store.round_trips > reads
@@ -0,0 +1,210 @@
+import asyncio
+
+import pytest
+
+from jobs import InMemoryJobBackend, JobQueue, RedisJobBackend
+
+# Redis can't store an empty hash, so payloads always carry a field
+PAYLOAD = {"student": b"%PDF", "scheme": b"%PDF"}
+
+
+def memory_backend():
+    return InMemoryJobBackend(max_queued=10)
+
+
+def redis_backend():
+    import fakeredis
+
+    return RedisJobBackend(fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer()), max_queued=10)
+
+
+@pytest.fixture(params=[memory_backend, redis_backend], ids=["memory", "redis"])
+def make_backend(request):
+    if request.param is redis_backend:
+        pytest.importorskip("fakeredis")
+    return request.param
+
+
+class Harness:
+    """A JobQueue whose handler blocks until released, recording refunds."""
+
+    def __init__(self, make_backend, workers: int = 1, fail_with: Exception = None, on_release=None):
+        self.abandoned: list[str] = []
+        self.handler_cancelled: list[str] = []
+        self.release = asyncio.Event()
+        self.fail_with = fail_with
+        self.on_release = on_release
+        self.backend = make_backend()
+        self.queue = JobQueue(self.backend, self.handler, self.on_abandon, workers=workers)
+
+    async def handler(self, job: dict, payload: dict) -> dict:
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.handler_cancelled.append(job["id"])
+            raise
+        if self.on_release:
+            await self.on_release(job)
+        if self.fail_with:
+            raise self.fail_with
+        return {"total": "1/1"}
+
+    async def on_abandon(self, job: dict):
+        self.abandoned.append(job["id"])
+
+    async def wait_for_status(self, job_id: str, status: str):
+        for _ in range(200):
+            job = await self.queue.get(job_id)
+            if job["status"] == status:
+                return job
+            await asyncio.sleep(0.005)
+        raise AssertionError(f"job never reached {status}: {job}")
+
+
+def test_job_runs_to_completion(make_backend):
+    async def scenario():
+        h = Harness(make_backend)
+        await h.queue.start()
+        job = await h.queue.submit("u1", PAYLOAD)
+        h.release.set()
+        done = await h.wait_for_status(job["id"], "done")
+        await h.queue.stop()
+        return h, done
+
+    h, done = asyncio.run(scenario())
+    assert done["result"] == {"total": "1/1"}
+    assert h.abandoned == []
+
+
+def test_cancel_running_job_refunds_once_and_worker_keeps_going(make_backend):
+    async def scenario():
+        h = Harness(make_backend)
+        await h.queue.start()
+        first = await h.queue.submit("u1", PAYLOAD)
+        await h.wait_for_status(first["id"], "running")
+        cancelled = await h.queue.cancel(first["id"])
+
+        second = await h.queue.submit("u1", PAYLOAD)
+        await h.wait_for_status(second["id"], "running")
+        h.release.set()
+        await h.wait_for_status(second["id"], "done")
+        await h.queue.stop()
+        return h, first, cancelled
+
+    h, first, cancelled = asyncio.run(scenario())
+    assert cancelled["status"] == "cancelled"
+    assert h.handler_cancelled == [first["id"]]
+    assert h.abandoned == [first["id"]]
+
+
+def test_cancel_queued_job_never_runs(make_backend):
+    async def scenario():
+        h = Harness(make_backend)
+        await h.queue.start()
+        running = await h.queue.submit("u1", PAYLOAD)
+        queued = await h.queue.submit("u1", PAYLOAD)
+        await h.wait_for_status(running["id"], "running")
+        await h.queue.cancel(queued["id"])
+        h.release.set()
+        await h.wait_for_status(running["id"], "done")
+        await asyncio.sleep(0.02)
+        job = await h.queue.get(queued["id"])
+        await h.queue.stop()
+        return h, queued, job
+
+    h, queued, job = asyncio.run(scenario())
+    assert job["status"] == "cancelled"
+    assert job["startedAt"] is None
+    assert h.abandoned == [queued["id"]]
+
+
+def test_stop_fails_and_refunds_running_and_queued_jobs(make_backend):
+    async def scenario():
+        h = Harness(make_backend, workers=1)
+        await h.queue.start()
+        running = await h.queue.submit("u1", PAYLOAD)
+        queued = await h.queue.submit("u2", PAYLOAD)
+        await h.wait_for_status(running["id"], "running")
+        # stop() used to hang here, with the job left running
+        await asyncio.wait_for(h.queue.stop(), timeout=1)
+        return h, running, queued, await h.queue.get(running["id"]), await h.queue.get(queued["id"])
+
+    h, running, queued, running_after, queued_after = asyncio.run(scenario())
+    assert running_after["status"] == "failed"
+    assert h.handler_cancelled == [running["id"]]
+    if h.backend.durable:
+        # The next worker to start picks it up
+        assert queued_after["status"] == "queued"
+        assert h.abandoned == [running["id"]]
+    else:
+        assert queued_after["status"] == "failed"
+        assert sorted(h.abandoned) == sorted([running["id"], queued["id"]])
+
+
+def test_failed_job_hides_exception_text(make_backend):
+    async def scenario():
+        h = Harness(make_backend, fail_with=RuntimeError("upstream said: invalid api key sk-123"))
+        await h.queue.start()
+        job = await h.queue.submit("u1", PAYLOAD)
+        h.release.set()
+        failed = await h.wait_for_status(job["id"], "failed")
+        await h.queue.stop()
+        return h, job, failed
+
+    h, job, failed = asyncio.run(scenario())
+    assert failed["error"] == "Marking failed"
+    assert h.abandoned == [job["id"]]
+
+
+def test_cancel_recorded_while_handler_finishes_wins(make_backend):
+    async def scenario():
+        # Another process cancels the job (and refunds it) just as the handler returns
+        async def cancel_elsewhere(job):
+            await h.backend.update(job["id"], status="cancelled")
+
+        h = Harness(make_backend, on_release=cancel_elsewhere)
+        await h.queue.start()
+        job = await h.queue.submit("u1", PAYLOAD)
+        h.release.set()
+        await h.wait_for_status(job["id"], "cancelled")
+        await asyncio.sleep(0.02)
+        after = await h.queue.get(job["id"])
+        await h.queue.stop()
+        return h, after
+
+    h, after = asyncio.run(scenario())
+    assert after["status"] == "cancelled"
+    assert after["result"] is None
+    assert h.abandoned == []
+
+
+def test_cancel_after_finish_does_not_refund(make_backend):
+    async def scenario():
+        h = Harness(make_backend)
+        await h.queue.start()
+        job = await h.queue.submit("u1", PAYLOAD)
+        h.release.set()
+        await h.wait_for_status(job["id"], "done")
+        after = await h.queue.cancel(job["id"])
+        await h.queue.stop()
+        return h, after
+
+    h, after = asyncio.run(scenario())
+    assert after["status"] == "done"
+    assert h.abandoned == []
+
+
+def test_update_only_applies_to_expected_status(make_backend):
+    async def scenario():
+        backend = make_backend()
+        await backend.enqueue({"id": "j1", "status": "queued"}, PAYLOAD)
+        skipped = await backend.update("j1", expect=("running",), status="done")
+        applied = await backend.update("j1", expect=("queued",), status="running")
+        missing = await backend.update("nope", status="running")
+        job = await backend.get("j1")
+        await backend.close()
+        return skipped, applied, missing, job
+
+    skipped, applied, missing, job = asyncio.run(scenario())
+    assert (skipped, applied, missing) == (False, True, False)
+    assert job["status"] == "running"
@@ -0,0 +1,193 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("pdf2image")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import httpx  # noqa: E402
+import openai  # noqa: E402
+
+import marking  # noqa: E402
+
+
+def api_error(cls, status: int, code: str = None):
+    request = httpx.Request("POST", "http://stub/v1/chat/completions")
+    return cls("stub failure", response=httpx.Response(status, request=request), body={"code": code} if code else None)
+
+
+def completion(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+
+
+def page_of(kwargs) -> str:
+    # The student page is the image block straight after the prompt
+    return kwargs["messages"][0]["content"][1]["image_url"]["url"].rsplit(",", 1)[1]
+
+
+class FakeCompletions:
+    """chat.completions stand-in; behaviour(page, attempt) returns text or raises."""
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.attempts: dict[str, int] = {}
+        self.cancelled: list[str] = []
+
+    async def create(self, **kwargs):
+        page = page_of(kwargs)
+        self.attempts[page] = self.attempts.get(page, 0) + 1
+        try:
+            return completion(await self.behaviour(page, self.attempts[page]))
+        except asyncio.CancelledError:
+            self.cancelled.append(page)
+            raise
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(marking, "MODEL_RETRY_BASE_DELAY", 0)
+
+    def install(behaviour) -> FakeCompletions:
+        completions = FakeCompletions(behaviour)
+        monkeypatch.setattr(marking, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+        return completions
+
+    return install
+
+
+def test_pages_are_joined_in_page_order(fake_model):
+    async def behaviour(page, attempt):
+        # Later pages finish first
+        await asyncio.sleep({"p1": 0.03, "p2": 0.02, "p3": 0.0}[page])
+        return f"marked {page}"
+
+    fake_model(behaviour)
+    raw = asyncio.run(marking.mark_with_vision(["p1", "p2", "p3"], ["scheme"]))
+    assert raw == "marked p1\n\nmarked p2\n\nmarked p3"
+
+
+@pytest.mark.parametrize("error", [
+    api_error(openai.RateLimitError, 429),
+    api_error(openai.InternalServerError, 500),
+    api_error(openai.InternalServerError, 503),
+])
+def test_rate_limits_and_server_errors_are_retried(fake_model, error):
+    async def behaviour(page, attempt):
+        if attempt < 3:
+            raise error
+        return f"marked {page}"
+
+    completions = fake_model(behaviour)
+    raw = asyncio.run(marking.mark_with_vision(["p1"], ["scheme"]))
+    assert raw == "marked p1"
+    assert completions.attempts == {"p1": 3}
+
+
+@pytest.mark.parametrize("error", [
+    api_error(openai.RateLimitError, 429, code="insufficient_quota"),
+    api_error(openai.BadRequestError, 400),
+])
+def test_permanent_errors_are_not_retried(fake_model, error):
+    async def behaviour(page, attempt):
+        raise error
+
+    completions = fake_model(behaviour)
+    with pytest.raises(type(error)):
+        asyncio.run(marking.mark_with_vision(["p1"], ["scheme"]))
+    assert completions.attempts == {"p1": 1}
+
+
+def test_retries_give_up_after_max_retries(fake_model, monkeypatch):
+    monkeypatch.setattr(marking, "MODEL_MAX_RETRIES", 2)
+
+    async def behaviour(page, attempt):
+        raise api_error(openai.InternalServerError, 502)
+
+    completions = fake_model(behaviour)
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(marking.mark_with_vision(["p1"], ["scheme"]))
+    assert completions.attempts == {"p1": 3}
+
+
+def test_failed_page_cancels_its_siblings(fake_model):
+    async def behaviour(page, attempt):
+        if page == "bad":
+            await asyncio.sleep(0.01)
+            raise api_error(openai.BadRequestError, 400)
+        await asyncio.sleep(10)
+        return f"marked {page}"
+
+    completions = fake_model(behaviour)
+
+    async def scenario():
+        with pytest.raises(openai.BadRequestError):
+            await marking.mark_with_vision(["p1", "bad", "p3"], ["scheme"])
+        # Let the cancellations land before checking
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert sorted(completions.cancelled) == ["p1", "p3"]
+
+
+SAMPLE_OUTPUT = """---
+
+Question Number: 1.1
+Question: Name the organelle where respiration happens.
+Max Marks: 1
+Student Answer: mitochondria
+Mark: 1/1
+Comment: Correct.
+
+---
+
+Question Number: 1.2
+Question: Explain why enzymes denature.
+Max Marks: 3
+Student Answer: the heat changes
+the shape of the active site
+Mark: 2/3
+Comment: Missing that the substrate
+no longer fits.
+
+---
+Total Marks: 3/4
+"""
+
+
+def parse_in_chunks(raw: str, sizes) -> tuple[list[dict], str]:
+    parser = marking.MarkingOutputParser()
+    questions, position = [], 0
+    for size in sizes:
+        questions += parser.feed(raw[position:position + size])
+        position += size
+    questions += parser.feed(raw[position:]) + parser.close()
+    return questions, parser.total
+
+
+@pytest.mark.parametrize("sizes", [
+    [1] * len(SAMPLE_OUTPUT),
+    [3, 7, 11, 5, 50, 2, 100],
+    [len(SAMPLE_OUTPUT)],
+])
+def test_parser_matches_parse_marking_output_for_any_chunking(sizes):
+    expected = marking.parse_marking_output(SAMPLE_OUTPUT)
+    questions, total = parse_in_chunks(SAMPLE_OUTPUT, sizes)
+    assert questions == expected["questions"]
+    assert total == expected["total"] == "3/4"
+    assert [q["questionNumber"] for q in questions] == ["1.1", "1.2"]
+
+
+def test_parser_handles_separator_split_across_chunks():
+    split = SAMPLE_OUTPUT.index("---", 10) + 1
+    parser = marking.MarkingOutputParser()
+    first = parser.feed(SAMPLE_OUTPUT[:split])
+    # "-" alone doesn't close the block, so nothing is emitted yet
+    assert first == []
+    second = parser.feed(SAMPLE_OUTPUT[split:split + 2])
+    assert [q["questionNumber"] for q in second] == ["1.1"]
+    rest = parser.feed(SAMPLE_OUTPUT[split + 2:]) + parser.close()
+    assert first + second + rest == marking.parse_marking_output(SAMPLE_OUTPUT)["questions"]
+    assert parser.total == "3/4"
@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("pdf2image")
+
+from rendering import MIN_RENDER_DPI, PDFTooLargeError, RenderSettings, effective_dpi, page_sizes  # noqa: E402
+
+A4 = (595 / 72, 842 / 72)
+
+
+def test_page_sizes_reads_every_page_line():
+    info = {
+        "Pages": "3",
+        "Page    1 size": "595 x 842 pts (A4)",
+        "Page    2 size": "842 x 595 pts",
+        "Page    3 size": "612.5 x 792 pts (letter)",
+        "Page size": "595 x 842 pts (A4)",
+        "Producer": "test",
+    }
+    assert page_sizes(info) == {1: A4, 2: (842 / 72, 595 / 72), 3: (612.5 / 72, 792 / 72)}
+
+
+def test_unknown_size_uses_configured_dpi():
+    assert effective_dpi(None, RenderSettings(dpi=200)) == 200
+
+
+def test_ordinary_page_keeps_configured_dpi():
+    assert effective_dpi(A4, RenderSettings(dpi=150, max_edge=2000)) == 150
+
+
+def test_max_edge_caps_dpi():
+    # 2000px over an 11.69in long edge
+    assert effective_dpi(A4, RenderSettings(dpi=300, max_edge=2000)) == 171
+
+
+def test_pixel_cap_lowers_dpi():
+    settings = RenderSettings(dpi=150, max_edge=0, max_page_pixels=1_000_000)
+    dpi = effective_dpi((20, 20), settings)
+    assert dpi == 50
+    assert 20 * 20 * dpi ** 2 <= settings.max_page_pixels
+
+
+def test_pixel_cap_and_max_edge_both_apply():
+    settings = RenderSettings(dpi=150, max_edge=500, max_page_pixels=1_000_000)
+    assert effective_dpi((20, 20), settings) == 25
+
+
+def test_page_at_min_dpi_is_rendered():
+    settings = RenderSettings(dpi=150, max_edge=0, max_page_pixels=100 * 100 * MIN_RENDER_DPI ** 2)
+    assert effective_dpi((100, 100), settings) == MIN_RENDER_DPI
+
+
+def test_page_below_min_dpi_is_rejected():
+    settings = RenderSettings(dpi=150, max_edge=0, max_page_pixels=1_000_000)
+    with pytest.raises(PDFTooLargeError):
+        effective_dpi((100, 100), settings)
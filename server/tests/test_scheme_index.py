@@ -0,0 +1,89 @@
+import pytest
+
+from scheme_index import index_scheme_lines, question_anchor, question_anchor_parts, scheme_excerpt
+
+FILLER = "award one mark for a correct explanation that refers to the particles " * 2
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("01.2 Explain why the reading changes", "1"),
+    ("03.1", "3"),
+    ("2(b)(ii) Calculate the current", "2"),
+    ("1 (a) State one hazard", "1"),
+    ("Q3 Describe the method", "3"),
+    ("Question 4", "4"),
+    ("4.2 V", "4"),
+    ("3 marks", None),
+    ("allow 4 V for 2 marks", None),
+    ("12.5", "12"),
+    ("Page 3 of 12", None),
+])
+def test_question_anchor(line, expected):
+    assert question_anchor(line) == expected
+
+
+def test_question_anchor_parts():
+    assert question_anchor_parts("03.2 Explain") == ("3", "2")
+    assert question_anchor_parts("2(b)(ii) Calculate") == ("2", "b")
+    assert question_anchor_parts("Q5") == ("5", None)
+    assert question_anchor_parts("no anchor here") is None
+
+
+def test_splits_questions_across_pages():
+    index = index_scheme_lines([
+        ["01.1 State the unit of power", FILLER],
+        [FILLER, "01.2 Calculate the power", FILLER, "02.1 Describe the method"],
+        [FILLER],
+    ])
+    assert sorted(index["questions"], key=int) == ["1", "2"]
+    assert index["questions"]["1"]["pages"] == [0, 1]
+    assert index["questions"]["2"]["pages"] == [1, 2]
+    assert "01.2 Calculate the power" in index["questions"]["1"]["text"]
+    assert index["page_count"] == 3
+
+
+def test_numeric_answer_does_not_open_a_question():
+    index = index_scheme_lines([[
+        "03.1 Calculate the potential difference",
+        "4.2 V",
+        "allow 4 V for 1 mark",
+        FILLER,
+        "03.2 Explain why the bulb gets brighter",
+        FILLER,
+        "04.1 Describe the motion",
+        FILLER,
+    ]])
+    assert sorted(index["questions"], key=int) == ["3", "4"]
+    assert "4.2 V" in index["questions"]["3"]["text"]
+    assert "03.2 Explain" in index["questions"]["3"]["text"]
+    assert "03.2" not in index["questions"]["4"]["text"]
+    assert "03.2 Explain" in scheme_excerpt(index, ["3"])
+
+
+def test_numeric_answer_in_current_question_is_kept_there():
+    index = index_scheme_lines([[
+        "01.1 Calculate the speed", "2.5 m/s", FILLER,
+        "02.1 Calculate the distance", "1.1 km", FILLER,
+    ]])
+    assert sorted(index["questions"], key=int) == ["1", "2"]
+    assert "1.1 km" in index["questions"]["2"]["text"]
+
+
+def test_large_forward_jump_is_an_answer():
+    index = index_scheme_lines([[
+        "01.1 Give the reading", "9.1 cm", FILLER, "02.1 Explain", FILLER,
+    ]])
+    assert sorted(index["questions"], key=int) == ["1", "2"]
+
+
+def test_inconsistent_index_falls_back_to_images():
+    # "Q4" forces a switch, then 03.2 shows question 3 wasn't finished
+    index = index_scheme_lines([[
+        "03.1 Calculate", FILLER, "Q4 see the table", FILLER, "03.2 Explain", FILLER,
+    ]])
+    assert index["questions"] == {}
+    assert scheme_excerpt(index, ["3"]) is None
+
+
+def test_short_text_layer_is_not_indexed():
+    assert index_scheme_lines([["01.1 Short"]])["questions"] == {}